@@ -4,26 +4,56 @@ from flask_socketio import SocketIO
 from apscheduler.schedulers.background import BackgroundScheduler
 from flask_jwt_extended import JWTManager
 from flask_pymongo import MongoClient
-from flask_bcrypt import Bcrypt
 from app.config import Config
+from app.services.metrics import CountingJSON, instrument_app, mongo_command_timer
+from app.services.log import configure_logging
+from app.services.mongo import client_options, read_preference, write_concern
+from app.services.passwords import password_hasher
 
 app = Flask(__name__)
 app.config.from_object(Config)
-socketio = SocketIO(app)
+# Before anything below starts a thread; see PasswordHasher
+password_hasher.start()
+configure_logging(Config)
+# With metrics enabled, emits are counted as packets are encoded and Mongo commands are timed
+metrics_enabled = app.config['METRICS_ENABLED']
+socketio = SocketIO(app, json=CountingJSON) if metrics_enabled else SocketIO(app)
 scheduler = BackgroundScheduler()
-bcrypt = Bcrypt()
 jwt = JWTManager(app)
 
-client = MongoClient(app.config['MONGODB_ATLAS_URI'])
+client = MongoClient(app.config['MONGODB_ATLAS_URI'], event_listeners=[mongo_command_timer] if metrics_enabled else [], **client_options(Config))
 chat_db = client.get_database(app.config['DATABASE_NAME'])
-users_collection = chat_db.get_collection(app.config['USERS_COLLECTION'])
-chat_messages_collection = chat_db.get_collection(app.config['CHAT_MESSAGES_COLLECTION'])
+users_collection = chat_db.get_collection(app.config['USERS_COLLECTION'], write_concern=write_concern(Config.USERS_WRITE_CONCERN))
+chat_messages_collection = chat_db.get_collection(app.config['CHAT_MESSAGES_COLLECTION'], write_concern=write_concern(Config.MESSAGES_WRITE_CONCERN))
+# Chat history reads, which may go to secondaries
+chat_history_collection = chat_messages_collection.with_options(read_preference=read_preference(Config.HISTORY_READ_PREFERENCE, Config.HISTORY_MAX_STALENESS_SECONDS))
+migrations_collection = chat_db.get_collection(app.config['MIGRATIONS_COLLECTION'])
+job_locks_collection = chat_db.get_collection(app.config['JOB_LOCKS_COLLECTION'])
+counters_collection = chat_db.get_collection(app.config['COUNTERS_COLLECTION'])
 
 from app.routes.auth import auth_bp
 from app.routes.chat import chat_bp
 from app.routes.friend_recommendation import friend_rec_bp
+from app.routes.metrics import metrics_bp
 from app.socket_events.chat_events import *
+from app.services.indexes import ensure_indexes
+from app.services.scheduled_jobs import register_jobs
+from app.services.presence import presence_persister
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(chat_bp)
 app.register_blueprint(friend_rec_bp)
+
+if metrics_enabled:
+    instrument_app(app)
+    app.register_blueprint(metrics_bp)
+
+ensure_indexes()
+
+def start_background_services():
+    # Threads a serving process needs, started by the server entry points (run.py, the ASGI app's
+    # startup) rather than on import, so scripts importing the app do not start them
+    presence_persister.start()
+    if app.config['SCHEDULER_ENABLED'] and not scheduler.running:
+        register_jobs(scheduler)
+        scheduler.start()
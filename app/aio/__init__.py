@@ -0,0 +1,28 @@
+# app/aio/__init__.py
+# Asyncio serving mode (SERVER_MODE=asyncio). Socket.IO connections are handled by python-socketio's
+# AsyncServer on an asyncio MongoDB client, so one process can hold many idle connections without
+# a thread each; the Flask REST routes are served through an ASGI adapter. Event names and
+# payloads are the same as in the default threading mode.
+import socketio as python_socketio
+from asgiref.wsgi import WsgiToAsgi
+from pymongo import AsyncMongoClient
+from app import app, start_background_services
+from app.config import Config
+from app.services.metrics import CountingJSON, mongo_command_timer
+from app.services.mongo import client_options, read_preference, write_concern
+
+async_client = AsyncMongoClient(Config.MONGODB_ATLAS_URI, event_listeners=[mongo_command_timer] if Config.METRICS_ENABLED else [], **client_options(Config))
+async_chat_db = async_client.get_database(Config.DATABASE_NAME)
+users_collection = async_chat_db.get_collection(Config.USERS_COLLECTION, write_concern=write_concern(Config.USERS_WRITE_CONCERN))
+chat_messages_collection = async_chat_db.get_collection(Config.CHAT_MESSAGES_COLLECTION, write_concern=write_concern(Config.MESSAGES_WRITE_CONCERN))
+chat_history_collection = chat_messages_collection.with_options(read_preference=read_preference(Config.HISTORY_READ_PREFERENCE, Config.HISTORY_MAX_STALENESS_SECONDS))
+
+sio = python_socketio.AsyncServer(async_mode='asgi', json=CountingJSON if Config.METRICS_ENABLED else None)
+
+from app.aio.chat_events import attach_fanout
+
+def on_startup():
+    attach_fanout()
+    start_background_services()
+
+asgi_app = python_socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(app), on_startup=on_startup)
@@ -0,0 +1,113 @@
+# app/aio/chat_events.py
+import asyncio
+from flask_jwt_extended import decode_token
+from app import app
+from app.aio import sio
+from app.aio.database import async_db
+from app.models.message import Message, conversation_id
+from app.services.fanout import fanout, InProcessBackend
+from app.services.metrics import timed_event
+from app.services.log import get_logger
+from app.services.presence import presence
+
+logger = get_logger('socket')
+
+def attach_fanout():
+    # Events published by any app instance are emitted to this server's clients on its event loop
+    loop = asyncio.get_running_loop()
+
+    def deliver(event, data, to):
+        asyncio.run_coroutine_threadsafe(sio.emit(event, data, to=to), loop)
+
+    fanout.deliver = deliver
+
+async def fan_out(event, data, to=None, users=None, skip_sid=None):
+    # Publishing to a remote backend without batching is a network round-trip; keep it off the loop
+    if fanout.flush_interval > 0 or isinstance(fanout.backend, InProcessBackend):
+        fanout.emit(event, data, to=to, users=users, skip_sid=skip_sid)
+    else:
+        await asyncio.to_thread(fanout.emit, event, data, to, users, skip_sid)
+
+@sio.event
+@timed_event('connect')
+async def connect(sid, environ, auth=None):
+    token = (auth or {}).get("token") if isinstance(auth, dict) else None
+    if token:
+        try:
+            with app.app_context():
+                username = decode_token(token)["sub"]
+        except Exception:
+            logger.warning("Rejected Socket.IO connection with an invalid token")
+            return False
+        presence.connect(username, sid)
+
+@sio.event
+@timed_event('disconnect')
+async def disconnect(sid, *args):
+    presence.disconnect(sid)
+
+@sio.on('heartbeat')
+@timed_event('heartbeat')
+async def handle_heartbeat(sid, data=None):
+    if presence.heartbeat(sid) is None:
+        await sio.emit('chat_error', {"message": "Unknown session, start a chat or reconnect with a token"}, to=sid)
+
+@sio.on('start_chat')
+@timed_event('start_chat')
+async def handle_start_chat_event(sid, data):
+    sender_username = data["username"]
+    receiver_username = data["receiver"]
+
+    username = presence.username_for(sid)
+    if username is None and data.get("token"):
+        try:
+            with app.app_context():
+                username = decode_token(data["token"])["sub"]
+        except Exception:
+            username = None
+    if username != sender_username:
+        await sio.emit('chat_error', {"message": "Authentication required"}, to=sid)
+        return
+    presence.connect(sender_username, sid)
+
+    receiver = await async_db.get_cached_user(receiver_username)
+    if receiver and presence.is_online(receiver_username):
+        await sio.emit('chat_started', {"message": "Chat started successfully", "conversation_id": conversation_id(sender_username, receiver_username)}, to=sid)
+    else:
+        await sio.emit('chat_error', {"message": "Receiver is offline"}, to=sid)
+
+@sio.on('send_message')
+@timed_event('send_message')
+async def handle_send_message_event(sid, data):
+    # The sender is the user this session is authenticated as, never the payload's "username".
+    # Sending counts as activity, like a heartbeat.
+    sender_username = presence.heartbeat(sid)
+    if sender_username is None:
+        await sio.emit('chat_error', {"message": "Authentication required"}, to=sid)
+        return
+    receiver_username = data["receiver"]
+    message_content = data["message"]
+
+    sender = await async_db.get_cached_user(sender_username)
+    receiver = await async_db.get_cached_user(receiver_username)
+
+    if sender and receiver:
+        if presence.is_online(receiver_username):
+            message = Message(sender_username=sender_username, receiver_username=receiver_username, content=message_content)
+            message_data = {
+                'sender': sender['username'],
+                'receiver': receiver['username'],
+                'content': message.to_dict()
+            }
+
+            if await async_db.save_chat_message(sender_username, receiver_username, message_content):
+                await fan_out('receive_message', message_data, users=list(dict.fromkeys([receiver['username'], sender['username']])), skip_sid=sid)
+                logger.info("Message from %s to %s delivered", sender_username, receiver_username)
+            else:
+                logger.warning("Message from %s to %s not delivered: it could not be saved", sender_username, receiver_username)
+                await sio.emit('error_message', {"message": "Message could not be saved"}, to=sid)
+        else:
+            logger.info("Message from %s not delivered: %s is offline", sender_username, receiver_username)
+            await sio.emit('error_message', {"message": "Receiver is offline"}, to=sid)
+    else:
+        logger.warning("Message from %s to %s rejected: unknown sender or receiver", sender_username, receiver_username)
@@ -0,0 +1,74 @@
+# app/aio/database.py
+import asyncio
+from datetime import datetime
+from pymongo.errors import PyMongoError
+from app.models.message import Message
+from app.aio import users_collection, chat_messages_collection, chat_history_collection
+from app.services.database import user_cache, message_writer
+from app.services.history_pages import history_query, history_page
+from app.services.message_writer import MessageQueueFull, MessageWriteError
+from app.services.log import get_logger
+
+logger = get_logger('db')
+message_logger = get_logger('messages')
+
+# Async counterparts of the Database methods used by the Socket.IO handlers, on the asyncio
+# MongoDB client. They share the user cache and message writer with the synchronous Database.
+class AsyncDatabase:
+    @staticmethod
+    async def get_user_by_username(username):
+        return await users_collection.find_one({"username": username})
+
+    @staticmethod
+    async def get_cached_user(username):
+        user = user_cache.get(username)
+        if user is None:
+            user = await users_collection.find_one({"username": username}, {"password": 0})
+            if user is not None:
+                user_cache.set(username, user)
+        return user
+
+    @staticmethod
+    async def set_user_online(username, online=True):
+        last_activity = datetime.now()
+        await users_collection.update_one({"username": username}, {"$set": {"online": online, "last_activity": last_activity}, "$currentDate": {"presence_updated_at": True}})
+
+        cached_user = user_cache.get(username)
+        if cached_user is not None:
+            user_cache.set(username, dict(cached_user, online=online, last_activity=last_activity))
+
+    @staticmethod
+    async def save_chat_message(sender_username, receiver_username, message_content):
+        try:
+            message = Message(sender_username=sender_username, receiver_username=receiver_username, content=message_content)
+            if message_writer is not None:
+                # submit() may block on a full queue or until the batch is written
+                await asyncio.to_thread(message_writer.submit, message.to_dict())
+            else:
+                await chat_messages_collection.insert_one(message.to_dict())
+            return True
+        except MessageQueueFull:
+            message_logger.error("Error saving message: message queue is full")
+            return False
+        except RuntimeError:
+            # The writer is closed: the process is shutting down
+            message_logger.error("Error saving message: message writer is closed")
+            return False
+        except MessageWriteError as e:
+            message_logger.error("Error saving message: %s", e)
+            return False
+        except PyMongoError as e:
+            message_logger.error("Error saving message: %s", e)
+            return False
+
+    @staticmethod
+    async def get_chat_history(sender_username, receiver_username, limit=50, before=None, after=None):
+        # Same keyset pagination and response as Database.get_chat_history
+        query, sort, newer = history_query(sender_username, receiver_username, before=before, after=after)
+        try:
+            documents = await chat_history_collection.find(query).sort(sort).limit(limit + 1).to_list()
+            return history_page(documents, limit, newer, after=after)
+        except PyMongoError as e:
+            logger.error("Error retrieving chat history: %s", e)
+
+async_db = AsyncDatabase()
@@ -10,3 +10,101 @@ class Config:
     DATABASE_NAME = os.getenv("DATABASE_NAME")
     USERS_COLLECTION = os.getenv("USERS_COLLECTION")
     CHAT_MESSAGES_COLLECTION = os.getenv("CHAT_MESSAGES_COLLECTION")
+    MIGRATIONS_COLLECTION = os.getenv("MIGRATIONS_COLLECTION", "migrations")
+    JOB_LOCKS_COLLECTION = os.getenv("JOB_LOCKS_COLLECTION", "job_locks")
+    COUNTERS_COLLECTION = os.getenv("COUNTERS_COLLECTION", "counters")
+
+    # MongoDB client: a pooling/server-selection preset ("default", "web" or "batch") and optional
+    # overrides of its options, passed to the driver as given (None leaves the preset's value)
+    MONGO_CLIENT_PROFILE = os.getenv("MONGO_CLIENT_PROFILE", "default")
+    MONGO_MAX_POOL_SIZE = os.getenv("MONGO_MAX_POOL_SIZE")
+    MONGO_MIN_POOL_SIZE = os.getenv("MONGO_MIN_POOL_SIZE")
+    MONGO_MAX_IDLE_TIME_MS = os.getenv("MONGO_MAX_IDLE_TIME_MS")
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS")
+    MONGO_CONNECT_TIMEOUT_MS = os.getenv("MONGO_CONNECT_TIMEOUT_MS")
+    MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS")
+    MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "chatapp")
+
+    # Write concern per collection ("majority" or a number of members) and the read preference of
+    # chat history reads, which may be served by secondaries at the cost of slightly stale pages
+    USERS_WRITE_CONCERN = os.getenv("USERS_WRITE_CONCERN", "majority")
+    MESSAGES_WRITE_CONCERN = os.getenv("MESSAGES_WRITE_CONCERN", "1")
+    HISTORY_READ_PREFERENCE = os.getenv("HISTORY_READ_PREFERENCE", "primary")
+    HISTORY_MAX_STALENESS_SECONDS = int(os.getenv("HISTORY_MAX_STALENESS_SECONDS", -1))
+
+    # Scheduled maintenance jobs (intervals in seconds)
+    SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+    IDLE_TIMEOUT_SECONDS = float(os.getenv("IDLE_TIMEOUT_SECONDS", 900))
+    IDLE_SWEEP_INTERVAL = float(os.getenv("IDLE_SWEEP_INTERVAL", 60))
+    CACHE_COMPACTION_INTERVAL = float(os.getenv("CACHE_COMPACTION_INTERVAL", 300))
+
+    # Password hashing: bcrypt cost factor, worker processes, and how many hashes may be queued or
+    # running before requests are refused with 503. Hashes with another cost are upgraded on login.
+    BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 64))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+    # Cache of user documents used by the chat hot path; the TTL bounds staleness across processes
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+
+    # Seconds between batched writes of presence changes (connects, disconnects, heartbeats)
+    PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", 2.0))
+    # Presence refreshes re-read changes stamped this many seconds before the last one seen, as a
+    # change stamped earlier can commit after a later one was read. Must exceed the flush interval.
+    PRESENCE_CHANGES_OVERLAP = float(os.getenv("PRESENCE_CHANGES_OVERLAP", 5.0))
+    ONLINE_USERS_PAGE_SIZE = int(os.getenv("ONLINE_USERS_PAGE_SIZE", 100))
+
+    # Chat history pages: default and maximum number of messages per page
+    CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", 50))
+    CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", 200))
+    CHAT_EXPORT_BATCH_SIZE = int(os.getenv("CHAT_EXPORT_BATCH_SIZE", 1000))
+
+    # Write-behind persistence of chat messages. MESSAGE_ACK_POLICY is "enqueue" (acknowledge once
+    # queued) or "flush" (acknowledge once written to MongoDB).
+    MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+    MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", 100))
+    MESSAGE_FLUSH_INTERVAL_MS = float(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", 50))
+    MESSAGE_QUEUE_SIZE = int(os.getenv("MESSAGE_QUEUE_SIZE", 10000))
+    MESSAGE_ENQUEUE_TIMEOUT = float(os.getenv("MESSAGE_ENQUEUE_TIMEOUT", 1.0))
+    MESSAGE_ACK_POLICY = os.getenv("MESSAGE_ACK_POLICY", "enqueue")
+    MESSAGE_ACK_TIMEOUT = float(os.getenv("MESSAGE_ACK_TIMEOUT", 10.0))
+
+    # Logging: global level, per-subsystem levels ("chatapp.socket=WARNING,chatapp.db=DEBUG"), "text"
+    # or "json" output, and the fraction of per-message INFO/DEBUG records kept on the hot path
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    # Latency histograms and counters for routes, Socket.IO events and MongoDB commands, at /metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Pushgateway job URL, e.g. http://pushgateway:9091/metrics/job/chatapp; unset disables pushing
+    METRICS_PUSH_URL = os.getenv("METRICS_PUSH_URL")
+    METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", 15))
+
+    # "threading" (default) serves Socket.IO with Flask-SocketIO; "asyncio" with python-socketio's
+    # AsyncServer and the asyncio MongoDB client under uvicorn
+    SERVER_MODE = os.getenv("SERVER_MODE", "threading")
+
+    # Socket.IO fan-out between app instances: "inprocess" for a single node or a redis:// URL.
+    # Outbound events are batched when FANOUT_FLUSH_INTERVAL_MS is above zero.
+    FANOUT_BACKEND = os.getenv("FANOUT_BACKEND", "inprocess")
+    FANOUT_CHANNEL = os.getenv("FANOUT_CHANNEL", "socketio-fanout")
+    FANOUT_BATCH_SIZE = int(os.getenv("FANOUT_BATCH_SIZE", 100))
+    FANOUT_FLUSH_INTERVAL_MS = float(os.getenv("FANOUT_FLUSH_INTERVAL_MS", 0))
+
+    # Friend recommendations: "exact" scans every user, "lsh" uses the approximate index
+    RECOMMENDATION_SEARCH_MODE = os.getenv("RECOMMENDATION_SEARCH_MODE", "exact")
+    RECOMMENDATION_LSH_TABLES = int(os.getenv("RECOMMENDATION_LSH_TABLES", 16))
+    RECOMMENDATION_LSH_BITS = int(os.getenv("RECOMMENDATION_LSH_BITS", 10))
+    RECOMMENDATION_BATCH_BLOCK_BYTES = int(os.getenv("RECOMMENDATION_BATCH_BLOCK_BYTES", 64 * 1024 * 1024))
+    RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 10000))
+    RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", 300))
+    RECOMMENDATION_SNAPSHOT_DIR = os.getenv("RECOMMENDATION_SNAPSHOT_DIR")
+    # Seconds between reads of newly registered users into each worker's recommendation index
+    RECOMMENDATION_SYNC_INTERVAL = float(os.getenv("RECOMMENDATION_SYNC_INTERVAL", 5))
+    REGISTRATION_GAP_TIMEOUT = float(os.getenv("REGISTRATION_GAP_TIMEOUT", 60))
@@ -0,0 +1,45 @@
+# app/migrations/backfill_conversation_id.py
+from pymongo import ASCENDING, UpdateOne
+from app.models.message import conversation_id
+from app.services.log import get_logger
+
+logger = get_logger('migrations')
+
+MIGRATION_NAME = "backfill_conversation_id"
+
+# Stamp conversation_id on messages written before it existed. Messages are processed in _id
+# order in batches, and the last processed _id is checkpointed in the migrations collection after
+# every batch, so an interrupted run resumes where it stopped.
+def backfill_conversation_ids(messages_collection, migrations_collection, batch_size=1000):
+    state = migrations_collection.find_one({"_id": MIGRATION_NAME}) or {}
+    if state.get("done"):
+        return 0
+
+    last_id = state.get("last_id")
+    updated = state.get("updated", 0)
+
+    while True:
+        query = {"conversation_id": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(
+            messages_collection.find(query, {"sender_username": 1, "receiver_username": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        messages_collection.bulk_write([
+            UpdateOne({"_id": message["_id"]}, {"$set": {"conversation_id": conversation_id(message["sender_username"], message["receiver_username"])}})
+            for message in batch
+        ], ordered=False)
+
+        last_id = batch[-1]["_id"]
+        updated += len(batch)
+        migrations_collection.update_one({"_id": MIGRATION_NAME}, {"$set": {"last_id": last_id, "updated": updated}}, upsert=True)
+        logger.info("Backfilled conversation_id on %d messages", updated)
+
+    migrations_collection.update_one({"_id": MIGRATION_NAME}, {"$set": {"done": True, "updated": updated}}, upsert=True)
+    return updated
@@ -1,12 +1,19 @@
 # app/models/message.py
 from datetime import datetime
 
+# Canonical id of the conversation between two users, independent of who sent the message.
+# The first username is length-prefixed so that no two pairs of usernames share an id.
+def conversation_id(first_username, second_username):
+    first, second = sorted([first_username, second_username])
+    return f"{len(first)}:{first}:{second}"
+
 class Message:
     def __init__(self, sender_username, receiver_username, content):
         self.sender_username = sender_username
         self.receiver_username = receiver_username
         self.content = content
         self.timestamp = datetime.now()
+        self.conversation_id = conversation_id(sender_username, receiver_username)
 
     def to_dict(self):
         # Convert the Message object to a dictionary
@@ -15,4 +22,11 @@ class Message:
             "receiver_username": self.receiver_username,
             "content": self.content,
             "timestamp": self.timestamp.isoformat(),
-        }
\ No newline at end of file
+            "conversation_id": self.conversation_id,
+        }
+
+# Convert a stored message document into a JSON-serialisable dictionary
+def message_document_to_json(document):
+    message = {key: value for key, value in document.items() if key != "_id"}
+    message["id"] = str(document["_id"])
+    return message
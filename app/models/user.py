@@ -7,6 +7,7 @@ class User:
         self.password = password
         self.online = False
         self.last_activity = None
+        self.interests = {}
 
     def to_dict(self):
         # Convert the User object to a dictionary
@@ -17,4 +18,5 @@ class User:
             "password": self.password,
             "online": self.online,
             "last_activity": self.last_activity,
+            "interests": self.interests,
         }
\ No newline at end of file
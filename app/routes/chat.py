@@ -1,17 +1,45 @@
 # app/routes/chat.py
-from flask import request, jsonify, Blueprint
+from datetime import datetime
+from flask import request, jsonify, Blueprint, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import users_collection
-from app.services.chat import get_user_chat_history
+from app import app
+from app.services.chat import get_user_chat_history, export_chat_history
+from app.services.presence import presence, presence_persister
+from app.services.fanout import fanout
+from app.services.log import get_logger
 
 chat_bp = Blueprint('chat', __name__)
+logger = get_logger('chat')
 
 @chat_bp.route('/api/online-users/')
 @jwt_required()
 def get_online_users():
-    online_users = users_collection.find({"online": True}, {"_id": 0, "password": 0})
-    online_user_list = list(online_users)
-    return jsonify({"online_users": online_user_list}), 200
+    # Served from the in-memory presence registry: ?offset=0&limit=100&since_version=<version>
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = max(request.args.get('limit', app.config['ONLINE_USERS_PAGE_SIZE'], type=int), 0)
+
+    # Clients polling with the version they last saw get a tiny response when nothing changed.
+    # Registry versions are per process, so the opaque version token names this process too: a
+    # token from another instance behind the load balancer never matches and gets a full page.
+    since_version = request.args.get('since_version')
+    if since_version is not None and since_version == presence_version_token(presence.version):
+        return jsonify({"version": since_version, "changed": False}), 200
+
+    page, total, version = presence.online_users(offset, limit)
+    online_user_list = [
+        {"username": username, "online": True, "last_activity": datetime.fromtimestamp(last_seen).isoformat() if last_seen else None}
+        for username, last_seen in page
+    ]
+    return jsonify({"online_users": online_user_list, "total": total, "offset": offset, "version": presence_version_token(version), "changed": True}), 200
+
+def presence_version_token(version):
+    return f"{presence_persister.node_id}:{version}"
+
+@chat_bp.route('/api/fanout-stats/')
+@jwt_required()
+def get_fanout_stats():
+    # Published/received event counts and delivery latency of events from other app instances
+    return jsonify(fanout.stats()), 200
 
 @chat_bp.route('/api/get_chat_history/', methods=['POST'])
 @jwt_required()
@@ -24,12 +52,45 @@ def get_chat_history():
         if not receiver_username:
             return jsonify({"message": "Receiver username is required"}), 400
 
-        chat_history = get_user_chat_history(sender_username, receiver_username)
+        try:
+            limit = int(data.get('limit', app.config['CHAT_HISTORY_PAGE_SIZE']))
+        except (TypeError, ValueError):
+            return jsonify({"message": "Limit must be an integer"}), 400
+        limit = max(1, min(limit, app.config['CHAT_HISTORY_MAX_PAGE_SIZE']))
+
+        if 'before' in data and 'after' in data:
+            return jsonify({"message": "Only one of before and after can be given"}), 400
+
+        try:
+            chat_history = get_user_chat_history(sender_username, receiver_username, limit=limit, before=data.get('before'), after=data.get('after'))
+        except ValueError:
+            return jsonify({"message": "Invalid cursor"}), 400
 
         if chat_history is not None:
-            return jsonify({"chat_history": chat_history}), 200
+            return jsonify(chat_history), 200
         else:
             return jsonify({"message": "An error occurred while retrieving chat history"}), 500
-    except Exception as e:
-        print(f"Unexpected error in get_chat_history: {str(e)}")
+    except Exception:
+        logger.exception("Unexpected error in get_chat_history")
         return jsonify({"message": "An unexpected error occurred"}), 500
+
+@chat_bp.route('/api/export_chat_history/', methods=['GET'])
+@jwt_required()
+def export_chat():
+    # Streams the full conversation as NDJSON: ?receiver=<username>&gzip=true&batch_size=1000
+    sender_username = get_jwt_identity()
+    receiver_username = request.args.get('receiver')
+    if not receiver_username:
+        return jsonify({"message": "Receiver username is required"}), 400
+
+    batch_size = request.args.get('batch_size', app.config['CHAT_EXPORT_BATCH_SIZE'], type=int)
+    if batch_size is None or batch_size < 1:
+        return jsonify({"message": "batch_size must be a positive integer"}), 400
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    headers = {"Content-Disposition": f'attachment; filename="chat_{sender_username}_{receiver_username}.ndjson"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+
+    stream = export_chat_history(sender_username, receiver_username, batch_size=batch_size, compress=compress)
+    return Response(stream_with_context(stream), mimetype='application/x-ndjson', headers=headers)
@@ -1,10 +1,68 @@
 # app/routes/friend_recommendation.py
-from flask import Blueprint
-from app.services.friend_recommendation import suggested_friends
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from app.services.friend_recommendation import suggested_friends, suggested_friends_batch, suggestions_cache, indexed_user_ids
+from app.services.log import get_logger
 
 friend_rec_bp = Blueprint('friend_recommendation', __name__)
+logger = get_logger('recommendations')
 
 @friend_rec_bp.route('/api/suggested-friends/<user_id>', methods=['GET'])
 def friend_recommendation_system(user_id):
-    recommendations = suggested_friends(user_id)
+    # Optional filters: ?min_age=20&max_age=30&online_only=true&exclude=4,8. A filter that is not
+    # given is None.
+    try:
+        exclude_ids = [int(excluded) for excluded in request.args.get('exclude', '').split(',') if excluded]
+    except ValueError:
+        return jsonify({'error': 'Invalid exclude list'}), 400
+    filters = {
+        'min_age': request.args.get('min_age', type=float),
+        'max_age': request.args.get('max_age', type=float),
+        'online_only': True if request.args.get('online_only', '').lower() in ('1', 'true', 'yes') else None,
+        'exclude_ids': exclude_ids or None,
+    }
+
+    recommendations = suggested_friends(user_id, request.args.get('top_n', 5), filters)
     return recommendations
+
+@friend_rec_bp.route('/api/suggested-friends/cache-stats', methods=['GET'])
+def friend_recommendation_cache_stats():
+    return jsonify(suggestions_cache.stats()), 200
+
+@friend_rec_bp.route('/api/suggested-friends/batch', methods=['POST'])
+def friend_recommendation_batch():
+    # Body: {"user_ids": [1, 2, ...], "top_n": 5}. Omitting user_ids streams every user.
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('user_ids')
+
+    try:
+        top_n = int(data.get('top_n', 5))
+        if user_ids is not None:
+            # Each id appears once in the response object
+            user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid user_ids or top_n'}), 400
+    if user_ids is None:
+        user_ids = indexed_user_ids()
+
+    # Stream a single JSON object keyed by user id, one entry per recommendation result. If
+    # scoring fails part-way, the remaining ids get an error entry so the body stays valid JSON.
+    def entry(position, user_id, result):
+        separator = ',\n' if position else '\n'
+        return f'{separator}{json.dumps(str(user_id))}: {json.dumps(result)}'
+
+    def generate():
+        yield '{'
+        position = 0
+        try:
+            for user_id, result in suggested_friends_batch(user_ids, top_n):
+                yield entry(position, user_id, result)
+                position += 1
+        except Exception:
+            logger.exception("Error computing batch recommendations")
+            for user_id in user_ids[position:]:
+                yield entry(position, user_id, {'error': 'Recommendation failed'})
+                position += 1
+        yield '\n}\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,10 @@
+# app/routes/metrics.py
+from flask import Blueprint, Response
+from app.services.metrics import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    # Request, Socket.IO and MongoDB metrics in the Prometheus text format
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,29 +1,30 @@
 # services/auth.py
 from app.models.user import User
-from app.services.database import db
+from app.services.database import db, DuplicateUserError
+from app.services.friend_recommendation import set_user_online
+from app.services.passwords import password_hasher, PasswordHasherBusy
+from app.services.log import get_logger
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from app import users_collection, bcrypt
 from flask_jwt_extended import create_access_token
 
+logger = get_logger('auth')
+
+BUSY_RESPONSE = {"error": "The server is busy. Please try again shortly."}, 503
+
 def register_user(data):
     username = data['username']
     email = data['email']
-    password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    try:
+        password = password_hasher.hash(data['password'])
+    except PasswordHasherBusy:
+        return BUSY_RESPONSE
     age = data['age']
     interests = data.get('interests', {})
 
-    print(f"Registering user: username={username}, email={email}")
-
-    # Check if a user with the same email or username already exists
-    existing_user_by_email = db.get_user_by_email(email)
-    existing_user_by_username = db.get_user_by_username(username)
-
-    if existing_user_by_email:
-        return {"error": "Email already exists. Please use a different email."}, 400
-    elif existing_user_by_username:
-        return {"error": "Username already exists. Please choose a different username."}, 400
+    logger.info("Registering user %s", username)
 
-    # If no user with the same email or username exists, create a new user
+    # Create the user in a single insert; the unique indexes reject an existing email or username
     new_user = User(username, age, email, password)
     new_user.interests = interests
 
@@ -31,29 +32,69 @@ def register_user(data):
     new_user.online = True
     new_user.last_activity = datetime.now()
 
-    if db.create_user(new_user.to_dict()):
-        print("User registered successfully")
-        return {"message": "User registered successfully"}, 200
+    user_document = new_user.to_dict()
+    try:
+        created = db.create_user(user_document)
+    except DuplicateUserError as e:
+        logger.info("Registration of %s rejected: duplicate %s", username, e.field)
+        if e.field == "email":
+            return {"error": "Email already exists. Please use a different email."}, 400
+        return {"error": "Username already exists. Please choose a different username."}, 400
+
+    if created:
+        logger.info("Registered user %s", username)
+        return {"message": "User registered successfully", "user_id": user_document["user_id"]}, 200
     else:
-        print("Username or email already exists")
         return {"error": "Registration failed. Please try again later."}, 500
 
 def login_user(data):
     username = data['username']
     password = data['password']
 
-    print(f"Logging in user: username={username}")
-
     user = db.get_user_by_username(username)
 
-    if user and bcrypt.check_password_hash(user['password'], password):
-        print("Login successful")
+    try:
+        valid = user is not None and password_hasher.check(user['password'], password)
+    except PasswordHasherBusy:
+        return BUSY_RESPONSE
+
+    if valid:
+        logger.info("User %s logged in", username)
+
+        # Hashes made with a different cost factor are upgraded in the background
+        if password_hasher.needs_rehash(user['password']):
+            rehash_password(username, user['password'], password)
 
         # Set online status and last_activity
-        users_collection.update_one({"username": username}, {"$set": {"online": True, "last_activity": datetime.now()}})
+        db.set_user_online(username)
+        set_user_online(username)
 
         access_token = create_access_token(identity=username)
         return {"message": "Login successful", "access_token": access_token}, 200
     else:
-        print("Invalid credentials")
+        logger.info("Invalid credentials for %s", username)
         return {"error": "Invalid username or password. Please try again."}, 401
+
+# Rehashed passwords are written from this thread. The hash's done-callback runs on the hashing
+# pool's own thread, which completes every other hash and must not wait on a majority write.
+rehash_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='password-rehash')
+
+def rehash_password(username, old_hash, password):
+    # A busy pool or failed write leaves the old hash in place; a later login tries again
+    try:
+        future = password_hasher.submit_hash(password)
+    except PasswordHasherBusy:
+        return
+
+    def store(future):
+        if not future.cancelled() and future.exception() is None:
+            db.update_user_password(username, old_hash, future.result().decode('utf-8'))
+
+    def hand_off(future):
+        try:
+            rehash_writer.submit(store, future)
+        except RuntimeError:
+            # The process is shutting down
+            pass
+
+    future.add_done_callback(hand_off)
@@ -1,20 +1,42 @@
 # services/chat.py
+import json
+import zlib
 from app.services.database import db
 from pymongo.errors import PyMongoError
+from app.services.log import get_logger
 
-def get_user_chat_history(sender_username, receiver_username):
-    try:
-        print(f"Retrieving chat history for sender {sender_username} and receiver {receiver_username}")
-
-        # Retrieve the chat history for the sender and receiver
-        chat_history = db.get_chat_history(sender_username, receiver_username)
+logger = get_logger('chat')
 
-        print("Chat history retrieved successfully.", chat_history)
-
-        return chat_history
+def get_user_chat_history(sender_username, receiver_username, limit=50, before=None, after=None):
+    try:
+        # Retrieve one page of the chat history for the sender and receiver
+        return db.get_chat_history(sender_username, receiver_username, limit=limit, before=before, after=after)
     except PyMongoError as e:
-        print(f"Error in get_user_chat_history: {str(e)}")
+        logger.error("Error in get_user_chat_history: %s", e)
         return None
-    except Exception as e:
-        print(f"Unexpected error in get_user_chat_history: {str(e)}")
+    except ValueError:
+        # Invalid pagination cursors are reported to the caller
+        raise
+    except Exception:
+        logger.exception("Unexpected error in get_user_chat_history")
         return None
+
+# Stream a whole conversation as newline-delimited JSON, optionally gzip-compressed. The output is
+# flushed after every `batch_size` messages so the first bytes are sent right away.
+def export_chat_history(sender_username, receiver_username, batch_size=1000, compress=False):
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    lines = []
+
+    def encode(chunk, final=False):
+        data = chunk.encode('utf-8')
+        if compressor is None:
+            return data
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    for message in db.iter_conversation(sender_username, receiver_username, batch_size=batch_size):
+        lines.append(json.dumps(message))
+        if len(lines) >= batch_size:
+            yield encode('\n'.join(lines) + '\n')
+            lines = []
+
+    yield encode('\n'.join(lines) + '\n' if lines else '', final=True)
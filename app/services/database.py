@@ -1,18 +1,88 @@
 # app/services/database.py
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
 from pymongo.errors import PyMongoError, DuplicateKeyError
-from bson import json_util
-from app.models.message import Message
-from app import users_collection, chat_messages_collection
+from app.config import Config
+from app.models.message import Message, message_document_to_json, conversation_id
+from app import users_collection, chat_messages_collection, chat_history_collection, counters_collection
+from app.services.cache import LRUCache
+from app.services.history_pages import history_query, history_page
+from app.services.friend_recommendation import index_registered_user, first_registered_user_id
+from app.services.message_writer import MessageWriteBehind, MessageQueueFull, MessageWriteError
+from app.services.log import get_logger
+
+logger = get_logger('db')
+message_logger = get_logger('messages')
+
+# In-process cache of user documents (without password) for the chat hot path. Entries are
+# refreshed or dropped on every write made through Database; the TTL bounds how stale an entry
+# can get when another process changes the user.
+user_cache = LRUCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+
+class DuplicateUserError(Exception):
+    # Raised by create_user when the username or email is already taken; `field` names which
+    def __init__(self, field):
+        super().__init__(f"Duplicate {field}")
+        self.field = field
+
+def duplicate_key_field(error, user):
+    # The server reports the violated key; if it does not, look it up (only on this error path)
+    details = error.details or {}
+    key_pattern = details.get("keyPattern") or details.get("keyValue")
+    if key_pattern:
+        return next(iter(key_pattern))
+    if users_collection.find_one({"email": user.get("email")}, {"_id": 1}):
+        return "email"
+    return "username"
+
+# User ids come from a counter document shared by every process, so each id names one user
+# however many workers register users. The counter is raised past the ids of the users.json
+# population (once per process) before the first id is taken.
+_user_id_floor = None
+
+def next_user_id():
+    global _user_id_floor
+    floor = first_registered_user_id() - 1
+    if _user_id_floor != floor:
+        counters_collection.update_one({"_id": "user_id"}, {"$max": {"seq": floor}}, upsert=True)
+        _user_id_floor = floor
+    counter = counters_collection.find_one_and_update({"_id": "user_id"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+    return counter["seq"]
+
+# Optional write-behind persistence for chat messages, batched with insert_many
+message_writer = None
+if Config.MESSAGE_WRITE_BEHIND:
+    message_writer = MessageWriteBehind(
+        chat_messages_collection,
+        batch_size=Config.MESSAGE_BATCH_SIZE,
+        flush_interval=Config.MESSAGE_FLUSH_INTERVAL_MS / 1000,
+        max_queue=Config.MESSAGE_QUEUE_SIZE,
+        enqueue_timeout=Config.MESSAGE_ENQUEUE_TIMEOUT,
+        ack_policy=Config.MESSAGE_ACK_POLICY,
+        ack_timeout=Config.MESSAGE_ACK_TIMEOUT,
+    )
 
 class Database:
     @staticmethod
     def create_user(user):
+        # A single insert; the unique username and email indexes reject duplicates atomically.
+        # The user's id is allocated first and stored on the document (as `user_id`).
         try:
+            user["user_id"] = next_user_id()
+            # Stamped in UTC like the server-side $currentDate of presence updates, so other
+            # instances' presence refreshes pick up the new user's status
+            user["presence_updated_at"] = datetime.now(timezone.utc)
             users_collection.insert_one(user)
-            return True
-        except DuplicateKeyError:
+        except DuplicateKeyError as e:
+            raise DuplicateUserError(duplicate_key_field(e, user))
+        except PyMongoError as e:
+            logger.error("Error creating user: %s", e)
             return False
 
+        user_cache.invalidate(user['username'])
+        index_registered_user(user)
+        return True
+
     @staticmethod
     def get_user_by_id(user_id):
         return users_collection.find_one({"_id": user_id})
@@ -23,35 +93,130 @@ class Database:
         return user
 
     @staticmethod
-    def save_chat_message(sender_username, receiver_username, message_content):
+    def get_cached_user(username):
+        user = user_cache.get(username)
+        if user is None:
+            user = users_collection.find_one({"username": username}, {"password": 0})
+            if user is not None:
+                user_cache.set(username, user)
+        return user
+
+    @staticmethod
+    def set_user_online(username, online=True):
+        # Persist the status and last_activity, and keep any cached copy in step with the write
+        last_activity = datetime.now()
+        users_collection.update_one({"username": username}, {"$set": {"online": online, "last_activity": last_activity}, "$currentDate": {"presence_updated_at": True}})
+
+        cached_user = user_cache.get(username)
+        if cached_user is not None:
+            user_cache.set(username, dict(cached_user, online=online, last_activity=last_activity))
+
+    @staticmethod
+    def set_users_presence(node_id, updates):
+        # Persist many users' presence on one app instance in one round-trip:
+        # {username: (connected to node_id, last_activity)}. Each user document lists the
+        # instances the user has sessions on in `presence_nodes`, and is online while that list
+        # is non-empty, so one instance losing its last session does not hide the others. Every
+        # write stamps `presence_updated_at` with the server's time (see get_presence_changes).
+        stamp = {"presence_updated_at": True}
+        requests = []
+        for username, (online, last_activity) in updates.items():
+            requests += [
+                UpdateOne({"username": username}, {"$addToSet" if online else "$pull": {"presence_nodes": node_id}, "$max": {"last_activity": last_activity}, "$currentDate": stamp}),
+                UpdateOne({"username": username, "presence_nodes.0": {"$exists": True}}, {"$set": {"online": True}, "$currentDate": stamp}),
+                UpdateOne({"username": username, "presence_nodes.0": {"$exists": False}}, {"$set": {"online": False}, "$currentDate": stamp}),
+            ]
+        # Ordered, so each user's online flag is derived after their presence_nodes update
+        users_collection.bulk_write(requests, ordered=True)
+
+        # The resulting online flag depends on other instances; re-read it on next use
+        for username in updates:
+            user_cache.invalidate(username)
+
+    @staticmethod
+    def get_presence_changes(since=None):
+        # Presence of the users whose status changed on any app instance after `since`, a cursor
+        # returned by the previous call, as ({username: (online, last_activity)}, next cursor).
+        # Without a cursor, every online user is returned (from the partial index) instead. The
+        # cursor is the latest `presence_updated_at` read; changes stamped up to
+        # PRESENCE_CHANGES_OVERLAP seconds before it are read again, so none is missed.
+        projection = {"_id": 0, "username": 1, "online": 1, "last_activity": 1, "presence_updated_at": 1}
+        if since is None:
+            latest = users_collection.find_one({"presence_updated_at": {"$exists": True}}, {"presence_updated_at": 1}, sort=[("presence_updated_at", DESCENDING)])
+            cursor = latest["presence_updated_at"] if latest else None
+            users = users_collection.find({"online": True}, projection)
+        else:
+            cursor = since
+            users = users_collection.find({"presence_updated_at": {"$gt": since - timedelta(seconds=Config.PRESENCE_CHANGES_OVERLAP)}}, projection)
+
+        changes = {}
+        for user in users:
+            changes[user["username"]] = (bool(user.get("online")), user.get("last_activity"))
+            updated_at = user.get("presence_updated_at")
+            if updated_at is not None and (cursor is None or updated_at > cursor):
+                cursor = updated_at
+        return changes, cursor
+
+    @staticmethod
+    def update_user_password(username, old_hash, new_hash):
+        # Only replaces the hash it was computed from, so a concurrent password change wins
         try:
-            print(f"Saving message from {sender_username} to {receiver_username}: {message_content}")
+            users_collection.update_one({"username": username, "password": old_hash}, {"$set": {"password": new_hash}})
+        except PyMongoError as e:
+            logger.error("Error updating password hash: %s", e)
+
+    @staticmethod
+    def invalidate_cached_user(username):
+        user_cache.invalidate(username)
 
+    @staticmethod
+    def save_chat_message(sender_username, receiver_username, message_content):
+        try:
             message = Message(sender_username=sender_username, receiver_username=receiver_username, content=message_content)
-            chat_messages_collection.insert_one(message.to_dict())
+            if message_writer is not None:
+                message_writer.submit(message.to_dict())
+            else:
+                chat_messages_collection.insert_one(message.to_dict())
 
-            print("Message saved successfully.")
+            message_logger.debug("Saved message from %s to %s", sender_username, receiver_username)
+            return True
+        except MessageQueueFull:
+            message_logger.error("Error saving message: message queue is full")
+            return False
+        except RuntimeError:
+            # The writer is closed: the process is shutting down
+            message_logger.error("Error saving message: message writer is closed")
+            return False
+        except MessageWriteError as e:
+            message_logger.error("Error saving message: %s", e)
+            return False
         except PyMongoError as e:
-            print(f"Error saving message: {str(e)}")
+            message_logger.error("Error saving message: %s", e)
+            return False
 
     @staticmethod
-    def get_chat_history(sender_username, receiver_username):
+    def get_chat_history(sender_username, receiver_username, limit=50, before=None, after=None):
+        # One page of the conversation using keyset pagination on (timestamp, _id). Without a
+        # cursor the newest `limit` messages are returned; `before` pages back to older messages
+        # and `after` fetches messages newer than a cursor. Messages are returned oldest first.
+        # Raises ValueError for a malformed cursor or when both cursors are given.
+        query, sort, newer = history_query(sender_username, receiver_username, before=before, after=after)
         try:
-            # Query the chat_messages collection to retrieve chat history
-            chat_history = chat_messages_collection.find({
-                "$or": [
-                    {"sender_username": sender_username, "receiver_username": receiver_username},
-                    {"sender_username": receiver_username, "receiver_username": sender_username}
-                ]
-            })
-
-            # Convert the chat history to a list of message dictionaries
-            chat_history_list = [json_util.dumps(message, default=json_util.default) for message in chat_history]
-
-            print("Chat history retrieved successfully.")
-            return chat_history_list
+            documents = list(chat_history_collection.find(query).sort(sort).limit(limit + 1))
+            page = history_page(documents, limit, newer, after=after)
+            logger.debug("Retrieved %d messages of conversation %s", len(page["chat_history"]), conversation_id(sender_username, receiver_username))
+            return page
         except PyMongoError as e:
-            print(f"Error retrieving chat history: {str(e)}")
+            logger.error("Error retrieving chat history: %s", e)
+
+    @staticmethod
+    def iter_conversation(sender_username, receiver_username, batch_size=1000):
+        # Every message of a conversation, oldest first, fetched from the server `batch_size`
+        # documents at a time so memory stays constant however long the conversation is
+        cursor = chat_history_collection.find({"conversation_id": conversation_id(sender_username, receiver_username)})
+        cursor = cursor.sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).batch_size(batch_size)
+        for document in cursor:
+            yield message_document_to_json(document)
 
     @staticmethod
     def get_user_by_email(email):
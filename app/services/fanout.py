@@ -0,0 +1,307 @@
+# app/services/fanout.py
+import atexit
+import json
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from urllib.parse import urlparse
+from app import socketio
+from app.config import Config
+from app.services.log import get_logger
+from app.services.presence import presence
+
+logger = get_logger('fanout')
+
+
+class InProcessBackend:
+    # Delivers published batches to subscribers in the same process, without serialising them.
+    # Used for single-node setups.
+    def __init__(self):
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        for callback in self._subscribers.get(channel, ()):
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def close(self):
+        self._subscribers.clear()
+
+
+class RespConnection:
+    # Minimal client for the Redis serialisation protocol (RESP2), enough for PUBLISH/SUBSCRIBE.
+    # `timeout` bounds connecting and every later read and write, until changed with settimeout().
+    def __init__(self, host, port, password=None, timeout=None):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._reader = self._socket.makefile('rb')
+        if password:
+            self.command('AUTH', password)
+
+    def settimeout(self, timeout):
+        self._socket.settimeout(timeout)
+
+    def send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._socket.sendall(b"".join(parts))
+
+    def read(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise ConnectionError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            return [self.read() for _ in range(int(rest))]
+        raise ConnectionError(f"Unexpected reply: {line!r}")
+
+    def command(self, *args):
+        self.send(*args)
+        return self.read()
+
+    def close(self):
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    # Publishes through a Redis server (or anything speaking the Redis protocol) so every app
+    # instance subscribed to the channel receives the message. Subscriptions reconnect on failure,
+    # and a message that cannot be decoded or handled is logged and skipped.
+    #
+    # Only subscriber connections wait for replies indefinitely. The publisher keeps `timeout`,
+    # so a stalled server fails publish() instead of blocking every emitter on the publish lock.
+    def __init__(self, url, reconnect_delay=1.0, timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.reconnect_delay = reconnect_delay
+        self.timeout = timeout
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._subscribers = []
+
+    def _connect(self):
+        return RespConnection(self.host, self.port, password=self.password, timeout=self.timeout)
+
+    def publish(self, channel, batch):
+        message = json.dumps(batch)
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect()
+                    return self._publisher.command('PUBLISH', channel, message)
+                except (OSError, ConnectionError):
+                    if self._publisher is not None:
+                        self._publisher.close()
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def subscribe(self, channel, callback):
+        thread = threading.Thread(target=self._listen, args=(channel, callback), name=f'fanout-subscriber-{channel}', daemon=True)
+        self._subscribers.append(thread)
+        thread.start()
+
+    def _listen(self, channel, callback):
+        while not self._closed.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                connection.command('SUBSCRIBE', channel)
+                # Messages may be far apart; block until the next one
+                connection.settimeout(None)
+                while not self._closed.is_set():
+                    reply = connection.read()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b'message':
+                        try:
+                            callback(json.loads(reply[2]))
+                        except Exception:
+                            logger.exception("Error handling fan-out message on %s", channel)
+            except (OSError, ConnectionError) as e:
+                if not self._closed.is_set():
+                    logger.warning("Fan-out subscription lost, reconnecting: %s", e)
+                    self._closed.wait(self.reconnect_delay)
+            except Exception:
+                # e.g. a malformed reply; start over on a new connection
+                if not self._closed.is_set():
+                    logger.exception("Fan-out subscription failed, reconnecting")
+                    self._closed.wait(self.reconnect_delay)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def close(self):
+        self._closed.set()
+        if self._publisher is not None:
+            self._publisher.close()
+
+
+class FanoutBus:
+    # Cross-process Socket.IO fan-out. emit() queues an event; events are published to the
+    # backend in batches (up to `batch_size` events or every `flush_interval` seconds) and every
+    # node subscribed to the channel, including this one, emits them to its local clients.
+    # With flush_interval=0 events are published immediately, one per message.
+    #
+    # Events addressed to `users` are resolved by every node to its own sessions of those users
+    # through `sessions` (username -> session ids), optionally skipping one session id.
+    #
+    # Each batch carries the sending node and time, so receiving nodes can report how long
+    # cross-node delivery took.
+    def __init__(self, backend, deliver, sessions=None, channel='socketio-fanout', batch_size=100, flush_interval=0.0, latency_samples=1000):
+        self.backend = backend
+        self.deliver = deliver
+        self.sessions = sessions
+        self.channel = channel
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.node_id = uuid.uuid4().hex
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+        # Counters are updated from the publisher, subscriber and request threads
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_samples)
+        self.published_batches = 0
+        self.published_events = 0
+        self.received_events = 0
+        self.remote_events = 0
+        self.backend.subscribe(channel, self._receive)
+
+    def emit(self, event, data, to=None, users=None, skip_sid=None):
+        entry = [event, data, to, users, skip_sid]
+        if self.flush_interval <= 0:
+            self._publish([entry])
+            return
+
+        self._start()
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='fanout-publisher', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.batch_size):
+            self._publish(pending[start:start + self.batch_size])
+
+    def _publish(self, events):
+        batch = {"node": self.node_id, "sent_at": time.time(), "events": events}
+        try:
+            self.backend.publish(self.channel, batch)
+            with self._stats_lock:
+                self.published_batches += 1
+                self.published_events += len(events)
+        except (OSError, ConnectionError) as e:
+            logger.error("Error publishing %d fan-out events: %s", len(events), e)
+
+    def _receive(self, batch):
+        with self._stats_lock:
+            if batch["node"] != self.node_id:
+                self._latencies.append(time.time() - batch["sent_at"])
+                self.remote_events += len(batch["events"])
+            self.received_events += len(batch["events"])
+        for event, data, to, users, skip_sid in batch["events"]:
+            # One failing event does not keep the rest of the batch from its recipients
+            try:
+                if users is None:
+                    self.deliver(event, data, to)
+                    continue
+                for username in users:
+                    for sid in self.sessions(username):
+                        if sid != skip_sid:
+                            self.deliver(event, data, sid)
+            except Exception:
+                logger.exception("Error delivering fan-out event %s", event)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            counts = {
+                "published_batches": self.published_batches,
+                "published_events": self.published_events,
+                "received_events": self.received_events,
+                "remote_events": self.remote_events,
+            }
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+        return {
+            "node": self.node_id,
+            **counts,
+            "remote_latency_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "max": latencies[-1] * 1000 if latencies else None, "samples": len(latencies)},
+        }
+
+    def close(self):
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(1)
+        self.flush()
+        self.backend.close()
+
+
+def create_backend(url):
+    # "inprocess" for a single node, or a redis://host:port URL for several nodes
+    if not url or url == 'inprocess':
+        return InProcessBackend()
+    if url.startswith('redis://'):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported fan-out backend: {url}")
+
+
+def _emit_locally(event, data, to):
+    socketio.emit(event, data, to=to)
+
+
+fanout = FanoutBus(
+    create_backend(Config.FANOUT_BACKEND),
+    _emit_locally,
+    sessions=presence.sessions,
+    channel=Config.FANOUT_CHANNEL,
+    batch_size=Config.FANOUT_BATCH_SIZE,
+    flush_interval=Config.FANOUT_FLUSH_INTERVAL_MS / 1000,
+)
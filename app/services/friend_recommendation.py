@@ -1,17 +1,22 @@
 # app/services/recommendation.py
 import json
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-import json
+import threading
+import time
+from app import users_collection
+from app.config import Config
+from recommender.index import RecommendationIndex
+from recommender.ann import RandomProjectionLSH
+from app.services.cache import LRUCache
+from recommender.snapshot import load_snapshot, snapshot_exists
+from app.services.log import get_logger
+from pymongo.errors import PyMongoError
 import os
 
+logger = get_logger('recommendations')
+
 # Load user data from the JSON file.
 file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'users.json')
 
-with open(file_path, 'r') as json_file:
-    users_data = json.load(json_file)
-
 """ users.json file
 {
     "users": [
@@ -37,19 +42,33 @@ with open(file_path, 'r') as json_file:
         },
 """
 
+# Index of every user the recommender knows about. It starts from users.json and grows as users
+# register through Database.create_user, so new users are recommendable without a restart.
+# When a prebuilt snapshot exists it is memory mapped instead of parsing users.json.
+def load_recommendation_index():
+    if snapshot_exists(Config.RECOMMENDATION_SNAPSHOT_DIR):
+        logger.info("Loading recommendation snapshot from %s", Config.RECOMMENDATION_SNAPSHOT_DIR)
+        return load_snapshot(Config.RECOMMENDATION_SNAPSHOT_DIR)
+
+    logger.info("Building recommendation index from %s", file_path)
+    with open(file_path, 'r') as json_file:
+        users_data = json.load(json_file)
+    return RecommendationIndex.from_users(users_data['users'])
+
+recommendation_index = load_recommendation_index()
+
+# Ids of users registered through the API start after the base population's
+_base_max_id = int(recommendation_index.ids.max()) if len(recommendation_index) else 0
+
+def first_registered_user_id():
+    return _base_max_id + 1
+
 # Function to get user's interests
 def get_user_interests(user_id):
-    user_index = user_id - 1  # User IDs are 1-based
-    user_interests = users_data['users'][user_index]['interests']
-    return user_interests
+    return recommendation_index.get_user_interests(user_id)
 
 # Function to explain the recommendation
-def explain_recommendation(user_id, recommended_friend_id):
-    user_interests = get_user_interests(user_id)
-    friend_interests = get_user_interests(recommended_friend_id)
-    
-    common_interests = set(user_interests.keys()) & set(friend_interests.keys())
-    
+def format_explanation(common_interests):
     if not common_interests:
         explanation = "You both have no common interests."
     else:
@@ -57,66 +76,167 @@ def explain_recommendation(user_id, recommended_friend_id):
     
     return explanation
 
-# Preprocess the data
-def preprocess_data(users_data):
-    print("Preprocessing data...")
-    # Convert user interests into a matrix
-    interests_matrix = []
-    for user in users_data['users']:
-        interests_vector = [user['interests'].get(interest, 0) for interest in all_interests]
-        interests_matrix.append(interests_vector)
-
-    # Standardize age and interests
-    age_vector = [user['age'] for user in users_data['users']]
-    scaler = StandardScaler()
-    age_vector = scaler.fit_transform(np.array(age_vector).reshape(-1, 1))
-    interests_matrix = scaler.fit_transform(interests_matrix)
-
-    return age_vector, interests_matrix
-
-def hybrid_recommendation_with_explanations(user_id, users_data, age_vector, interests_matrix, top_n=5):
-    user_index = user_id - 1  # User IDs are 1-based
-    user_features = np.hstack([age_vector, interests_matrix])
-    user_profile = user_features[user_index]
-
-    similarities = cosine_similarity([user_profile], user_features)[0]
-    similar_users_indices = np.argsort(similarities)[::-1]
-    similar_users_indices = similar_users_indices[similar_users_indices != user_index]
-    top_similar_users_indices = similar_users_indices[:top_n]
+def explain_recommendation(user_id, recommended_friend_id, index=recommendation_index):
+    common_interests = index.common_interests(user_id, [index.row_of(recommended_friend_id)])[0]
+    return format_explanation(common_interests)
+
+# Register a user created through the API with the recommender, under the id stored on its document
+def index_registered_user(user, index=recommendation_index):
+    try:
+        user_id = index.add_user(user['username'], user['age'], user.get('interests', {}), user_id=user['user_id'], username=user['username'])
+        index.set_online(user['username'], bool(user.get('online')))
+        return user_id
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning("Could not add user to recommendation index: %s", e)
+        return None
+
+# Users registered through any worker are read back from MongoDB, at startup and then every
+# RECOMMENDATION_SYNC_INTERVAL seconds (a scheduled job), so every worker can recommend them.
+# Each sync reads the users above a watermark on `user_id`. Ids are allocated before the insert,
+# so a lower id can become visible after a higher one: the watermark stays below an id that has
+# not appeared yet, until it is REGISTRATION_GAP_TIMEOUT seconds old (its insert failed).
+_sync_state = {'index': None, 'watermark': 0, 'gaps': {}}
+_sync_lock = threading.Lock()
+
+def sync_registered_users(index=recommendation_index, clock=time.monotonic):
+    with _sync_lock:
+        if _sync_state['index'] is not index:
+            _sync_state.update(index=index, watermark=first_registered_user_id() - 1, gaps={})
+        watermark, gaps = _sync_state['watermark'], _sync_state['gaps']
+
+        try:
+            users = list(users_collection.find({"user_id": {"$gt": watermark}}, {"username": 1, "age": 1, "interests": 1, "user_id": 1, "online": 1}).sort("user_id", 1))
+        except PyMongoError as e:
+            logger.error("Error loading registered users into the recommendation index: %s", e)
+            return 0
+
+        added = 0
+        for user in users:
+            if user['user_id'] not in index and index_registered_user(user, index) is not None:
+                added += 1
+
+        seen = {user['user_id'] for user in users}
+        highest = max(seen, default=watermark)
+        now = clock()
+        gaps = {user_id: gaps.get(user_id, now) for user_id in range(watermark + 1, highest) if user_id not in seen}
+        gaps = {user_id: since for user_id, since in gaps.items() if now - since < Config.REGISTRATION_GAP_TIMEOUT}
+        _sync_state['watermark'] = min(gaps, default=highest + 1) - 1
+        _sync_state['gaps'] = gaps
+
+    if added:
+        logger.info("Added %d registered users to the recommendation index", added)
+    return added
+
+sync_registered_users()
+
+# Approximate index. New users are hashed into it as they are added; it is only rebuilt after the
+# recommendation index refits its features. Recall against the exact search is measured by
+# tests/recommendation_benchmark.py rather than on the request path.
+_ann_state = {'index': None, 'epoch': None, 'ann': None}
+_ann_lock = threading.Lock()
+
+def get_ann_index(index=recommendation_index):
+    with _ann_lock:
+        epoch = index.normalization_epoch
+        features = index.normalized_features()
+        if _ann_state['index'] is not index or _ann_state['epoch'] != epoch:
+            ann = RandomProjectionLSH(features, n_tables=Config.RECOMMENDATION_LSH_TABLES, n_bits=Config.RECOMMENDATION_LSH_BITS)
+            logger.info("Built LSH index over %d users (tables=%d, bits=%d)", features.shape[0], ann.n_tables, ann.n_bits)
+            _ann_state.update(index=index, epoch=epoch, ann=ann)
+        elif _ann_state['ann'].count < features.shape[0]:
+            _ann_state['ann'].update(features)
+        return _ann_state['ann']
+
+def hybrid_recommendation_with_explanations(user_id, index=recommendation_index, top_n=5, mode=None, filters=None):
+    mode = mode or Config.RECOMMENDATION_SEARCH_MODE
+
+    # Optional filters (min_age, max_age, online_only, exclude_ids) narrow the scored users to
+    # a candidate subset from the index's age buckets and presence bitmap
+    candidates = index.candidate_rows(**filters) if filters else None
+
+    if candidates is not None:
+        top_similar_users_indices, _ = index.search(user_id, top_n, candidates=candidates)
+    elif mode == 'lsh':
+        top_similar_users_indices, _ = get_ann_index(index).search(index.row_of(user_id), top_n)
+    else:
+        top_similar_users_indices, _ = index.search(user_id, top_n)
+
+    return explain_recommendations(user_id, top_similar_users_indices, index)
 
+def explain_recommendations(user_id, top_similar_users_indices, index=recommendation_index):
     recommendations_with_explanations = []
 
-    for i in top_similar_users_indices:
-        friend_id = users_data['users'][i]['id']
-        friend_name = users_data['users'][i]['name']  # Get the friend's name
-        explanation = explain_recommendation(user_id, friend_id)
+    # Common interests for all recommended friends at once, strongest shared interest first
+    common_interests = index.common_interests(user_id, top_similar_users_indices)
+
+    for i, friend_common_interests in zip(top_similar_users_indices, common_interests):
+        friend_name = index.name_of(i)  # Get the friend's name
+        explanation = format_explanation(friend_common_interests)
         recommendations_with_explanations.append({'friend_name': friend_name, 'explanation': explanation})
 
     return recommendations_with_explanations
 
-# Preprocess the data
-print("Getting all interests...")
-all_interests = set()
-for user in users_data['users']:
-    all_interests.update(user['interests'].keys())
+# Keep the recommender's presence bitmap in step with a user's online status
+def set_user_online(username, online=True):
+    return recommendation_index.set_online(username, online)
 
-age_vector, interests_matrix = preprocess_data(users_data)
+# Serialised suggested_friends responses. Keys include the index version, so any change to the
+# index makes older entries unreachable and they age out of the LRU.
+suggestions_cache = LRUCache(maxsize=Config.RECOMMENDATION_CACHE_SIZE, ttl=Config.RECOMMENDATION_CACHE_TTL)
 
 # Function to get friend recommendations with explanations
-def suggested_friends(user_id):
+def suggested_friends(user_id, top_n=5, filters=None):
     try:
         user_id = int(user_id)
     except ValueError:
         return json.dumps({'error': 'Invalid user_id'}), 400  # Return a JSON error response with a status code
 
-    print(f"Received request for user {user_id}...")
+    try:
+        top_n = int(top_n)
+    except ValueError:
+        return json.dumps({'error': 'Invalid top_n'}), 400
+
+    if user_id not in recommendation_index:
+        return json.dumps({'error': 'User not found'}), 404
+
+    # Unset filters are None (an age bound of 0 is a real bound)
+    filters = {name: value for name, value in (filters or {}).items() if value is not None}
+    cache_key = (user_id, top_n, Config.RECOMMENDATION_SEARCH_MODE, recommendation_index.version, repr(sorted(filters.items())))
+    if filters.get('online_only'):
+        cache_key += (recommendation_index.presence_version,)
+    cached_response = suggestions_cache.get(cache_key)
+    if cached_response is not None:
+        return cached_response, 200
 
     # Get friend recommendations with explanations
-    recommendations_with_explanations = hybrid_recommendation_with_explanations(user_id, users_data, age_vector, interests_matrix)
+    recommendations_with_explanations = hybrid_recommendation_with_explanations(user_id, top_n=top_n, filters=filters)
 
     # Prepare the JSON response
     recommended_friends = [{'friend_name': recommendation['friend_name'], 'explanation': recommendation['explanation']} for recommendation in recommendations_with_explanations]
 
-    response = {'recommended_friends': recommended_friends}
+    response = json.dumps({'recommended_friends': recommended_friends}).encode('utf-8')
+    suggestions_cache.set(cache_key, response)
+
+    return response, 200  # Return the JSON response with a 200 status code
+
+def indexed_user_ids():
+    return recommendation_index.ids.tolist()
+
+# Function to get friend recommendations for many users at once. Users are scored in blocks of
+# one matrix product each; yields (user_id, response) pairs so callers can stream the results.
+def suggested_friends_batch(user_ids=None, top_n=5):
+    if user_ids is None:
+        user_ids = indexed_user_ids()
+
+    # Membership is decided once: users indexed while the results stream must not shift them
+    known_ids = [user_id for user_id in user_ids if user_id in recommendation_index]
+    known = set(known_ids)
+    results = recommendation_index.search_batch(known_ids, top_n, block_bytes=Config.RECOMMENDATION_BATCH_BLOCK_BYTES)
+
+    for user_id in user_ids:
+        if user_id not in known:
+            yield user_id, {'error': 'User not found'}
+            continue
 
-    return json.dumps(response), 200  # Return the JSON response with a 200 status code
\ No newline at end of file
+        result_id, rows, _ = next(results)
+        yield result_id, {'recommended_friends': explain_recommendations(result_id, rows)}
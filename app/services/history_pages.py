@@ -0,0 +1,64 @@
+# app/services/history_pages.py
+import base64
+import binascii
+import json
+from pymongo import ASCENDING, DESCENDING
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.models.message import message_document_to_json, conversation_id
+
+# Keyset pagination of a conversation on (timestamp, _id), shared by the synchronous and asyncio
+# database layers. history_query() describes the find() to run and history_page() turns its
+# results into the response, so both layers page identically.
+
+# Opaque pagination cursors encoding a message's (timestamp, _id) sort key
+def encode_cursor(document):
+    key = json.dumps([document["timestamp"], str(document["_id"])])
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return timestamp, ObjectId(message_id)
+    except (ValueError, TypeError, binascii.Error, InvalidId):
+        raise ValueError("Invalid cursor")
+
+def keyset_condition(cursor_value, newer):
+    # Messages strictly after (newer=True) or before the cursor in (timestamp, _id) order
+    timestamp, message_id = cursor_value
+    operator = "$gt" if newer else "$lt"
+    return {"$or": [{"timestamp": {operator: timestamp}}, {"timestamp": timestamp, "_id": {operator: message_id}}]}
+
+def history_query(sender_username, receiver_username, before=None, after=None):
+    # Returns (filter, sort, newer). An empty cursor counts as absent, for both the direction
+    # and the cursor, so `after=""` is the same as no `after`. Raises ValueError when both
+    # cursors are given or a cursor is malformed.
+    if before is not None and after is not None:
+        raise ValueError("Only one of before and after can be given")
+    newer = bool(after)
+    cursor = after if newer else before
+
+    # Served by the (conversation_id, timestamp, _id) index as a single range scan
+    query = {"conversation_id": conversation_id(sender_username, receiver_username)}
+    if cursor:
+        query = {"$and": [query, keyset_condition(decode_cursor(cursor), newer)]}
+
+    direction = ASCENDING if newer else DESCENDING
+    return query, [("timestamp", direction), ("_id", direction)], newer
+
+def history_page(documents, limit, newer, after=None):
+    # `documents` are up to limit + 1 results of history_query(), in its sort order
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    if not newer:
+        documents.reverse()
+
+    oldest = encode_cursor(documents[0]) if documents else None
+    newest = encode_cursor(documents[-1]) if documents else (after or None)
+    return {
+        "chat_history": [message_document_to_json(document) for document in documents],
+        # Pass as `before` to load older messages; None once the start of the conversation is reached
+        "before_cursor": oldest if (has_more or newer) else None,
+        # Pass as `after` to poll for messages newer than this page
+        "after_cursor": newest,
+    }
@@ -0,0 +1,49 @@
+# app/services/indexes.py
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from app import users_collection, chat_messages_collection
+from app.services.log import get_logger
+
+logger = get_logger('db')
+
+# Indexes the application relies on, declared per collection. ensure_indexes() creates any that
+# are missing at startup and leaves existing ones alone, so it is safe to run on every boot.
+def declared_indexes():
+    return [
+        (users_collection, [
+            # Registration relies on these to reject duplicates in a single insert
+            IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+            IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+            # Workers read newly registered users into their recommendation index by user_id
+            IndexModel([("user_id", ASCENDING)], name="user_id", partialFilterExpression={"user_id": {"$exists": True}}),
+            # Only online users are indexed, keeping the index as small as the online set. Also
+            # serves the idle-user sweep, which filters online users by last_activity.
+            IndexModel([("online", ASCENDING), ("last_activity", ASCENDING)], name="online_last_activity", partialFilterExpression={"online": True}),
+            # Presence refreshes read only the users whose status changed since the last one
+            IndexModel([("presence_updated_at", ASCENDING)], name="presence_updated_at", partialFilterExpression={"presence_updated_at": {"$exists": True}}),
+        ]),
+        (chat_messages_collection, [
+            # Conversation pages and exports are read as one range of this index
+            IndexModel([("conversation_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="conversation_timestamp"),
+        ]),
+    ]
+
+# Without these, registration could create duplicate accounts, so startup fails when they are
+# missing and cannot be created (e.g. existing duplicates) instead of running without them
+REQUIRED_INDEXES = ('username_unique', 'email_unique')
+
+def ensure_indexes():
+    unavailable = []
+    for collection, indexes in declared_indexes():
+        try:
+            existing = collection.index_information()
+            missing = [index for index in indexes if index.document["name"] not in existing]
+            if missing:
+                collection.create_indexes(missing)
+                logger.info("Created indexes on %s: %s", collection.name, ', '.join(index.document['name'] for index in missing))
+        except PyMongoError as e:
+            logger.error("Error creating indexes on %s: %s", collection.name, e)
+            unavailable.extend(index.document["name"] for index in indexes if index.document["name"] in REQUIRED_INDEXES)
+
+    if unavailable:
+        raise RuntimeError(f"Required indexes are missing: {', '.join(unavailable)}")
@@ -0,0 +1,129 @@
+# app/services/log.py
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# Every subsystem logs to a child of this logger, e.g. "chatapp.socket" or "chatapp.db", so levels
+# can be set per subsystem with LOG_LEVELS
+ROOT_LOGGER = 'chatapp'
+
+# Subsystems logging once or more per chat message; their INFO and DEBUG records are sampled
+HOT_PATH_LOGGERS = ('chatapp.socket', 'chatapp.messages')
+
+# Attributes every LogRecord has; anything else was passed through `extra` and is a structured field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def get_logger(subsystem):
+    return logging.getLogger(f'{ROOT_LOGGER}.{subsystem}')
+
+
+def structured_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    # "<time> <LEVEL> <logger>: <message> key=value ..."
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = structured_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    # One JSON object per line with the message and any structured fields
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(structured_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # Lets through one in every `every` records below WARNING, counted per message template, so a
+    # high-volume event still shows up at a known rate. Warnings and errors always pass.
+    def __init__(self, rate):
+        super().__init__()
+        self.every = round(1 / rate) if rate > 0 else 0
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.every == 1:
+            return True
+        if self.every == 0:
+            return False
+        count = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Hands records to the listener thread with only the message merged with its arguments, as
+    # the stdlib QueueHandler does, so arguments changed after the call (or not safe to read from
+    # another thread) cannot alter what is logged. Formatting and writing, including exception
+    # tracebacks, happen off the calling thread. When the queue is full the record is dropped
+    # instead of blocking.
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # A copy, so other handlers of the record still see the original msg and args
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+
+def configure_logging(config):
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter() if config.LOG_FORMAT == 'json' else TextFormatter())
+
+    handler = DeferredQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(config.LOG_LEVEL.upper())
+
+    # "chatapp.socket=WARNING,werkzeug=ERROR"
+    for entry in filter(None, (part.strip() for part in config.LOG_LEVELS.split(','))):
+        name, _, level = entry.partition('=')
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    if config.LOG_SAMPLE_RATE < 1:
+        for name in HOT_PATH_LOGGERS:
+            logging.getLogger(name).addFilter(SamplingFilter(config.LOG_SAMPLE_RATE))
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
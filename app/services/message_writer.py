@@ -0,0 +1,146 @@
+# app/services/message_writer.py
+import atexit
+import queue
+import threading
+import time
+from pymongo.errors import PyMongoError
+from app.services.log import get_logger
+
+logger = get_logger('messages')
+
+ACK_ON_ENQUEUE = 'enqueue'
+ACK_ON_FLUSH = 'flush'
+
+
+class MessageQueueFull(Exception):
+    pass
+
+
+class MessageWriteError(Exception):
+    # Raised by submit() under the "flush" ack policy when the message's batch was not written
+    pass
+
+
+class MessageWriteTimeout(MessageWriteError):
+    pass
+
+
+class _PendingWrite:
+    def __init__(self, document):
+        self.document = document
+        self.done = threading.Event()
+        self.error = None
+
+
+class MessageWriteBehind:
+    # Write-behind buffer for chat messages. Messages are appended to a bounded queue and a
+    # background thread persists them with insert_many once `batch_size` messages are waiting or
+    # `flush_interval` seconds have passed since the first one.
+    #
+    # When the queue is full, submit() blocks for up to `enqueue_timeout` seconds (backpressure
+    # on the caller) and then raises MessageQueueFull. With the "flush" ack policy submit() only
+    # returns once the message's batch has been written, raising MessageWriteError if it failed
+    # or was not written within `ack_timeout` seconds; with "enqueue" it returns immediately.
+    #
+    # Once close() has begun, submit() is refused, and the writer thread only exits after every
+    # submit already in progress has queued its message and the queue is empty.
+    def __init__(self, collection, batch_size=100, flush_interval=0.05, max_queue=10000, enqueue_timeout=1.0, ack_policy=ACK_ON_ENQUEUE, ack_timeout=10.0):
+        if ack_policy not in (ACK_ON_ENQUEUE, ACK_ON_FLUSH):
+            raise ValueError(f"Unknown ack policy: {ack_policy}")
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.ack_policy = ack_policy
+        self.ack_timeout = ack_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = threading.Event()
+        self._state_lock = threading.Lock()
+        self._submitting = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='message-write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, document):
+        with self._state_lock:
+            if self._closed.is_set():
+                raise RuntimeError("Message writer is closed")
+            self._submitting += 1
+        try:
+            self.start()
+            pending = _PendingWrite(document)
+            try:
+                self._queue.put(pending, timeout=self.enqueue_timeout)
+            except queue.Full:
+                raise MessageQueueFull("Message queue is full")
+        finally:
+            with self._state_lock:
+                self._submitting -= 1
+
+        if self.ack_policy == ACK_ON_FLUSH:
+            if not pending.done.wait(self.ack_timeout):
+                raise MessageWriteTimeout("Message was not written in time")
+            if pending.error is not None:
+                raise MessageWriteError(f"Message was not written: {pending.error}") from pending.error
+        return pending
+
+    def pending_count(self):
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        # Wait for the first message, then gather more until the batch is full or the flush
+        # interval measured from that first message runs out
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        # Any failure (not only PyMongoError, e.g. an unencodable document) fails this batch's
+        # waiters and leaves the writer running for the next batch
+        try:
+            self.collection.insert_many([pending.document for pending in batch], ordered=False)
+        except PyMongoError as e:
+            logger.error("Error saving %d messages: %s", len(batch), e)
+            for pending in batch:
+                pending.error = e
+        except Exception as e:
+            logger.exception("Unexpected error saving %d messages", len(batch))
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def _finished(self):
+        with self._state_lock:
+            return self._closed.is_set() and self._submitting == 0 and self._queue.empty()
+
+    def _run(self):
+        while not self._finished():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def close(self, timeout=10):
+        # Stop accepting messages and flush everything already queued
+        with self._state_lock:
+            self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
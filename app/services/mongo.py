@@ -0,0 +1,54 @@
+# app/services/mongo.py
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from pymongo.write_concern import WriteConcern
+
+# Connection pool and server selection presets, chosen with MONGO_CLIENT_PROFILE. Individual
+# MONGO_* settings override the preset. "default" leaves every option to the driver.
+CLIENT_PROFILES = {
+    "default": {},
+    # Request/Socket.IO workers: a warm pool, and a short wait for a connection so an exhausted
+    # pool fails fast instead of piling up requests
+    "web": {"maxPoolSize": 100, "minPoolSize": 10, "waitQueueTimeoutMS": 2000, "serverSelectionTimeoutMS": 5000},
+    # Batch jobs and scripts: few connections, patient server selection
+    "batch": {"maxPoolSize": 10, "serverSelectionTimeoutMS": 30000},
+}
+
+_READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def client_options(config):
+    if config.MONGO_CLIENT_PROFILE not in CLIENT_PROFILES:
+        raise ValueError(f"Unknown MongoDB client profile: {config.MONGO_CLIENT_PROFILE}")
+
+    options = dict(CLIENT_PROFILES[config.MONGO_CLIENT_PROFILE])
+    overrides = {
+        "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": config.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": config.MONGO_CONNECT_TIMEOUT_MS,
+        "compressors": config.MONGO_COMPRESSORS,
+        "appname": config.MONGO_APP_NAME,
+    }
+    options.update({key: value for key, value in overrides.items() if value not in (None, "")})
+    return options
+
+
+def write_concern(value):
+    # "majority", or a number of acknowledging members ("0" for unacknowledged writes)
+    return WriteConcern(w=value if value == "majority" else int(value))
+
+
+def read_preference(name, max_staleness=-1):
+    if name not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    if name == "primary":
+        return Primary()
+    return _READ_PREFERENCES[name](max_staleness=max_staleness)
@@ -0,0 +1,104 @@
+# app/services/passwords.py
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from app.config import Config
+
+
+class PasswordHasherBusy(Exception):
+    # Raised when the hashing pool has no room for another request; callers answer 503
+    pass
+
+
+def hash_rounds(password_hash):
+    # Cost factor of an existing bcrypt hash ("$2b$12$..." -> 12)
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    # Runs bcrypt in a pool of worker processes so bursts of logins do not tie up the threads
+    # serving chat traffic. At most `max_pending` hashes may be queued or running at once; further
+    # requests are refused straight away with PasswordHasherBusy rather than waiting in line.
+    #
+    # Workers are forked so they never import the application, and are given the bcrypt
+    # functions themselves; salts are generated here, which is cheap. A forked child only gets
+    # the forking thread, so a lock another thread held at that moment stays locked in it for
+    # good: start() must fork the workers before the process starts any other thread (logging,
+    # MongoDB monitors, Socket.IO). Without a started pool, e.g. where fork is unavailable or
+    # after the pool broke, hashes run on a thread pool instead, as bcrypt releases the GIL.
+    def __init__(self, workers=2, max_pending=64, rounds=12, timeout=10.0):
+        self.workers = workers
+        self.rounds = rounds
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def start(self):
+        with self._lock:
+            if self._executor is None and 'fork' in multiprocessing.get_all_start_methods():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('fork'),
+                )
+                # The first task forks every worker, before the executor starts its own thread
+                self._executor.submit(os.getpid).result()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+            return self._executor
+
+    def _submit(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Password hashing queue is full")
+        try:
+            future = self._pool().submit(function, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            with self._lock:
+                self._executor = None
+            raise PasswordHasherBusy("Password hashing pool is unavailable")
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result(self.timeout)
+        except (TimeoutError, BrokenProcessPool):
+            raise PasswordHasherBusy("Password hashing timed out")
+
+    def submit_hash(self, password):
+        return self._submit(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+
+    def hash(self, password):
+        return self._result(self.submit_hash(password)).decode('utf-8')
+
+    def check(self, password_hash, password):
+        return self._result(self._submit(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8')))
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_QUEUE_SIZE,
+    rounds=Config.BCRYPT_LOG_ROUNDS,
+    timeout=Config.PASSWORD_HASH_TIMEOUT,
+)
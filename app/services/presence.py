@@ -0,0 +1,254 @@
+# app/services/presence.py
+import atexit
+import threading
+import time
+import uuid
+from datetime import datetime
+from app.config import Config
+from app.services.database import db
+from app.services.friend_recommendation import set_user_online
+from app.services.log import get_logger
+
+logger = get_logger('presence')
+
+
+class PresenceRegistry:
+    # Presence as seen by this process: the Socket.IO sessions connected here (username -> session
+    # ids and last-seen time) merged with a snapshot of the users MongoDB reports online on any
+    # app instance. A user is online while they have a session here or in the snapshot. `version`
+    # is bumped whenever the set of online users changes, so clients can poll cheaply by sending
+    # back the version they last saw, and `on_change(username, online)` is called for each change.
+    # With an `idle_timeout`, a local session only counts while its user was active within it,
+    # matching the idle sweep that marks such users offline in MongoDB.
+    #
+    # Local changes are not written to MongoDB one event at a time. Each user's latest state on
+    # this node is kept in a pending map (later events overwrite earlier ones) and persisted in
+    # batches by PresencePersister, which also keeps the snapshot current: it is loaded once
+    # (apply_snapshot) and then updated with the changes made since (apply_changes).
+    def __init__(self, clock=time.time, on_change=None, idle_timeout=None):
+        self._clock = clock
+        self.on_change = on_change
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._user_by_sid = {}
+        # Only kept for users with a session here, so it is bounded by the local connections
+        self._last_seen = {}
+        self._pending = {}
+        # username -> last activity timestamp of users online on any instance
+        self._shared = {}
+        self._online = set()
+        self._sorted_usernames = []
+        self._sorted_version = None
+        self.version = 0
+
+    def connect(self, username, sid):
+        now = self._clock()
+        changes = []
+        with self._lock:
+            previous = self._user_by_sid.get(sid)
+            if previous == username:
+                self._touch(username, now)
+                return
+            if previous is not None:
+                self._remove_session(sid, now, changes)
+
+            self._sessions.setdefault(username, set()).add(sid)
+            self._user_by_sid[sid] = username
+            self._touch(username, now)
+            self._update_online(username, changes)
+        self._notify(changes)
+
+    def disconnect(self, sid):
+        changes = []
+        with self._lock:
+            username = self._remove_session(sid, self._clock(), changes)
+        self._notify(changes)
+        return username
+
+    def heartbeat(self, sid):
+        changes = []
+        with self._lock:
+            username = self._user_by_sid.get(sid)
+            if username is not None:
+                self._touch(username, self._clock())
+                self._update_online(username, changes)
+        self._notify(changes)
+        return username
+
+    def _touch(self, username, now):
+        self._last_seen[username] = now
+        self._pending[username] = (True, now)
+
+    def _remove_session(self, sid, now, changes):
+        username = self._user_by_sid.pop(sid, None)
+        if username is None:
+            return None
+
+        sessions = self._sessions.get(username)
+        sessions.discard(sid)
+        if not sessions:
+            del self._sessions[username]
+            del self._last_seen[username]
+            self._pending[username] = (False, now)
+            self._update_online(username, changes)
+        return username
+
+    def _active_here(self, username):
+        if username not in self._sessions:
+            return False
+        return self.idle_timeout is None or self._last_seen[username] >= self._clock() - self.idle_timeout
+
+    def _update_online(self, username, changes):
+        online = self._active_here(username) or username in self._shared
+        if online != (username in self._online):
+            if online:
+                self._online.add(username)
+            else:
+                self._online.discard(username)
+            self.version += 1
+            changes.append((username, online))
+
+    def _notify(self, changes):
+        if self.on_change is None:
+            return
+        for username, online in changes:
+            try:
+                self.on_change(username, online)
+            except Exception:
+                logger.exception("Error handling presence change of %s", username)
+
+    def apply_snapshot(self, online):
+        # Replace the cluster-wide snapshot with {username: last activity timestamp}; local
+        # sessions are re-checked too, as they may have gone idle since the last snapshot
+        changes = []
+        with self._lock:
+            previous, self._shared = self._shared, online
+            for username in (previous.keys() ^ online.keys()) | self._sessions.keys():
+                self._update_online(username, changes)
+        self._notify(changes)
+        return len(changes)
+
+    def apply_changes(self, changes):
+        # Update the cluster-wide snapshot with {username: (online, last activity timestamp)}
+        # for the users whose presence changed; local sessions are re-checked as above
+        result = []
+        with self._lock:
+            for username, (online, last_activity) in changes.items():
+                if online:
+                    self._shared[username] = last_activity
+                else:
+                    self._shared.pop(username, None)
+            for username in changes.keys() | self._sessions.keys():
+                self._update_online(username, result)
+        self._notify(result)
+        return len(result)
+
+    def username_for(self, sid):
+        return self._user_by_sid.get(sid)
+
+    def sessions(self, username):
+        with self._lock:
+            return list(self._sessions.get(username, ()))
+
+    def is_online(self, username):
+        return username in self._online
+
+    def last_seen(self, username):
+        seen = self._last_seen.get(username)
+        return seen if seen is not None else self._shared.get(username)
+
+    def online_users(self, offset=0, limit=None):
+        # A page of online usernames in a stable (sorted) order, plus the total count and the
+        # version the page was taken at. The sorted list is rebuilt at most once per version.
+        with self._lock:
+            if self._sorted_version != self.version:
+                self._sorted_usernames = sorted(self._online)
+                self._sorted_version = self.version
+            usernames = self._sorted_usernames
+            end = None if limit is None else offset + limit
+            page = [(username, self.last_seen(username)) for username in usernames[offset:end]]
+            return page, len(usernames), self.version
+
+    def local_users(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def drain_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+
+class PresencePersister:
+    # Background thread that, every `interval` seconds, writes this node's coalesced presence
+    # changes with `write(node_id, updates)` and then refreshes the registry's cluster-wide
+    # snapshot. `load(cursor)` returns ({username: (online, last_activity)}, next cursor): every
+    # online user for a None cursor, otherwise the changes since the cursor, so only the first
+    # refresh reads the whole online set. Started with the app by start_background_services().
+    def __init__(self, registry, write, load, interval=2.0):
+        self.registry = registry
+        self.write = write
+        self.load = load
+        self.interval = interval
+        # Identifies this process's sessions in the shared presence state
+        self.node_id = uuid.uuid4().hex
+        self._cursor = None
+        self._refresh_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='presence-persister', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def flush(self):
+        pending = self.registry.drain_pending()
+        if pending:
+            self.write(self.node_id, {username: (online, datetime.fromtimestamp(seen)) for username, (online, seen) in pending.items()})
+        return len(pending)
+
+    def refresh(self):
+        # Also run by the idle sweep, so concurrent refreshes are serialised around the cursor
+        with self._refresh_lock:
+            full = self._cursor is None
+            changes, self._cursor = self.load(self._cursor)
+            changes = {
+                username: (online, last_activity.timestamp() if last_activity else None)
+                for username, (online, last_activity) in changes.items()
+            }
+            if full:
+                return self.registry.apply_snapshot({username: seen for username, (online, seen) in changes.items() if online})
+            return self.registry.apply_changes(changes)
+
+    def _run(self):
+        while True:
+            try:
+                self.flush()
+                self.refresh()
+            except Exception:
+                logger.exception("Error synchronising presence")
+            if self._stopped.wait(self.interval):
+                break
+
+    def close(self):
+        # Sessions held by this process end with it, so withdraw them from the shared state
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 1)
+        try:
+            self.flush()
+            now = datetime.now()
+            local_users = self.registry.local_users()
+            if local_users:
+                self.write(self.node_id, {username: (False, now) for username in local_users})
+        except Exception:
+            logger.exception("Error persisting presence")
+
+
+presence = PresenceRegistry(on_change=set_user_online, idle_timeout=Config.IDLE_TIMEOUT_SECONDS)
+presence_persister = PresencePersister(presence, db.set_users_presence, db.get_presence_changes, interval=Config.PRESENCE_FLUSH_INTERVAL)
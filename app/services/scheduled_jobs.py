@@ -0,0 +1,86 @@
+# app/services/scheduled_jobs.py
+import os
+import socket
+from datetime import datetime, timedelta
+import requests
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from app import app, users_collection, job_locks_collection
+from app.services.database import user_cache
+from app.services.friend_recommendation import suggestions_cache, sync_registered_users
+from app.services.presence import presence_persister
+from app.services.metrics import registry
+from app.services.log import get_logger
+
+logger = get_logger('jobs')
+
+# Identifies this process as the owner of a job lock
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+def acquire_job_lock(job_name, lease_seconds):
+    # Lease-based lock in MongoDB so a cluster-wide job runs in only one worker process per
+    # interval. The lease is taken if it is free, expired, or already held by this worker.
+    now = datetime.now()
+    try:
+        job_locks_collection.find_one_and_update(
+            {"_id": job_name, "$or": [{"expires_at": {"$lte": now}}, {"owner": WORKER_ID}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=lease_seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease, so the upsert collided with its document
+        return False
+
+def mark_idle_users_offline():
+    # Cluster-wide: a single update_many over the (online, last_activity) index. Also covers users
+    # whose instance exited without withdrawing their sessions from presence_nodes.
+    if not acquire_job_lock("mark_idle_users_offline", app.config['IDLE_SWEEP_INTERVAL']):
+        return 0
+
+    cutoff = datetime.now() - timedelta(seconds=app.config['IDLE_TIMEOUT_SECONDS'])
+    result = users_collection.update_many({"online": True, "last_activity": {"$lt": cutoff}}, {"$set": {"online": False, "presence_nodes": []}, "$currentDate": {"presence_updated_at": True}})
+    if result.modified_count:
+        # Cached user documents may still say online; drop them rather than serve stale presence
+        user_cache.clear()
+        # Update this process's presence registry and recommender bitmap now; other processes
+        # pick the change up on their next presence refresh
+        presence_persister.refresh()
+        logger.info("Marked %d idle users offline", result.modified_count)
+    return result.modified_count
+
+def compact_caches():
+    # Per process: drop expired entries so they stop holding memory until their next lookup
+    return user_cache.purge_expired() + suggestions_cache.purge_expired()
+
+def flush_presence():
+    # Per process: make sure coalesced presence changes reach MongoDB even without socket traffic
+    return presence_persister.flush()
+
+def push_metrics():
+    # Per process: push this process's metrics to a Prometheus Pushgateway, grouped by worker so
+    # processes do not overwrite each other. For deployments that cannot scrape every worker.
+    url = f"{app.config['METRICS_PUSH_URL'].rstrip('/')}/instance/{WORKER_ID}"
+    try:
+        response = requests.put(url, data=registry.render(), headers={"Content-Type": "text/plain; version=0.0.4"}, timeout=5)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.warning("Error pushing metrics to %s: %s", url, e)
+
+def run_job(job):
+    try:
+        job()
+    except PyMongoError:
+        logger.exception("Error running scheduled job %s", job.__name__)
+
+def register_jobs(scheduler):
+    jobs = [
+        (mark_idle_users_offline, app.config['IDLE_SWEEP_INTERVAL']),
+        (compact_caches, app.config['CACHE_COMPACTION_INTERVAL']),
+        (flush_presence, app.config['PRESENCE_FLUSH_INTERVAL']),
+        (sync_registered_users, app.config['RECOMMENDATION_SYNC_INTERVAL']),
+    ]
+    if app.config['METRICS_ENABLED'] and app.config['METRICS_PUSH_URL']:
+        jobs.append((push_metrics, app.config['METRICS_PUSH_INTERVAL']))
+    for job, interval in jobs:
+        # coalesce/max_instances stop a slow run from stacking up overlapping runs in this process
+        scheduler.add_job(run_job, 'interval', args=[job], seconds=interval, id=job.__name__, replace_existing=True, coalesce=True, max_instances=1)
@@ -1,68 +1,106 @@
 # socket_events/chat_events.py
-from app import socketio, app, users_collection
+from app import socketio
 from app.services.database import db
-from datetime import datetime
+from app.services.presence import presence
+from app.services.fanout import fanout
+from app.services.metrics import timed_event
+from app.services.log import get_logger
 from flask import request
-from app.models.message import Message
-from flask_socketio import join_room, emit
+from app.models.message import Message, conversation_id
+from flask_socketio import emit
+from flask_jwt_extended import decode_token
+
+logger = get_logger('socket')
+
+@socketio.on('connect')
+@timed_event('connect')
+def handle_connect(auth=None):
+    # Clients may authenticate the connection with {"token": <access token>}; otherwise the
+    # session is associated with a user on its first start_chat
+    token = (auth or {}).get("token") if isinstance(auth, dict) else None
+    if token:
+        try:
+            username = decode_token(token)["sub"]
+        except Exception:
+            logger.warning("Rejected Socket.IO connection with an invalid token")
+            return False
+        presence.connect(username, request.sid)
+
+@socketio.on('disconnect')
+@timed_event('disconnect')
+def handle_disconnect(*args):
+    presence.disconnect(request.sid)
+
+@socketio.on('heartbeat')
+@timed_event('heartbeat')
+def handle_heartbeat(data=None):
+    if presence.heartbeat(request.sid) is None:
+        emit('chat_error', {"message": "Unknown session, start a chat or reconnect with a token"})
 
 @socketio.on('start_chat')
+@timed_event('start_chat')
 def handle_start_chat_event(data):
+    # Registers this session as the sender's, so messages to the sender are delivered to it. The
+    # session must be authenticated: by a token on connect, or a "token" in this event.
     sender_username = data["username"]
     receiver_username = data["receiver"]
 
-    print("Sender: ", sender_username)
+    username = presence.username_for(request.sid)
+    if username is None and data.get("token"):
+        try:
+            username = decode_token(data["token"])["sub"]
+        except Exception:
+            username = None
+    if username != sender_username:
+        emit('chat_error', {"message": "Authentication required"})
+        return
+    presence.connect(sender_username, request.sid)
 
-    # Check if the receiver is online and available, and then join the chat room
-    receiver = db.get_user_by_username(receiver_username)
-    if receiver and receiver['online']:
-        chat_room = f"{sender_username}_{receiver_username}"
-        join_room(chat_room)
-        emit('chat_started', {"message": "Chat started successfully", "chat_room": chat_room})
+    # Check if the receiver is online and available, as the presence registry sees them
+    receiver = db.get_cached_user(receiver_username)
+    if receiver and presence.is_online(receiver_username):
+        emit('chat_started', {"message": "Chat started successfully", "conversation_id": conversation_id(sender_username, receiver_username)})
     else:
-        emit('chat_error', {"message": "Receiver is offline"}, room=request.sid)
+        emit('chat_error', {"message": "Receiver is offline"})
 
 @socketio.on('send_message')
+@timed_event('send_message')
 def handle_send_message_event(data):
-    sender_username = data["username"]
+    # The sender is the user this session is authenticated as, never the payload's "username".
+    # Sending counts as activity, like a heartbeat.
+    sender_username = presence.heartbeat(request.sid)
+    if sender_username is None:
+        emit('chat_error', {"message": "Authentication required"})
+        return
     receiver_username = data["receiver"]
     message_content = data["message"]
 
-    # Find the sender and receiver users in the database
-    sender = db.get_user_by_username(sender_username)
-    receiver = db.get_user_by_username(receiver_username)
+    # Find the sender and receiver users, served from the user cache in the steady state
+    sender = db.get_cached_user(sender_username)
+    receiver = db.get_cached_user(receiver_username)
 
     if sender and receiver:
-        app.logger.info("Sender and receiver found in the database")
-
-        if receiver['online']:
+        if presence.is_online(receiver_username):
             # Create a Message object and add it to the chat
             message = Message(sender_username=sender_username, receiver_username=receiver_username, content=message_content)
-
-            app.logger.info("Message from {} to {}: {}".format(sender['username'], receiver['username'], message.to_dict()))
-
-            # Emit the message to the sender and receiver in their chat room
-            chat_room = f"{sender['username']}_{receiver['username']}"
             message_data = {
                 'sender': sender['username'],  # Include the sender's username
                 'receiver': receiver['username'],
                 'content': message.to_dict()  # Include the message content
             }
 
-            db.save_chat_message(sender_username, receiver_username, message_content)
-
-            app.logger.info("Message emitted in chat room {}: {}".format(chat_room, message.to_dict()))
-            emit('receive_message', message_data, room=chat_room)
-
-            app.logger.info("Message sent and chat history updated")
+            # Only messages that were saved are delivered, so nobody sees a message missing from the history
+            if db.save_chat_message(sender_username, receiver_username, message_content):
+                # Deliver to every session of the receiver and to the sender's other sessions, on
+                # whichever app instance they are connected to
+                fanout.emit('receive_message', message_data, users=list(dict.fromkeys([receiver['username'], sender['username']])), skip_sid=request.sid)
+                logger.info("Message from %s to %s delivered", sender_username, receiver_username)
+            else:
+                logger.warning("Message from %s to %s not delivered: it could not be saved", sender_username, receiver_username)
+                emit('error_message', {"message": "Message could not be saved"})
 
         else:
-            app.logger.error("Receiver is offline")
-            chat_room = f"{sender['username']}_{receiver['username']}"
-            emit('error_message', {"message": "Receiver is offline"}, room=chat_room)
-
-        # Check if sender is offline and update their online status and last_activity
-        if not sender['online']:
-            users_collection.update_one({"username": sender_username}, {"$set": {"online": True, "last_activity": datetime.now()}})
+            logger.info("Message from %s not delivered: %s is offline", sender_username, receiver_username)
+            emit('error_message', {"message": "Receiver is offline"})
     else:
-        app.logger.error("Sender or receiver not found")
+        logger.warning("Message from %s to %s rejected: unknown sender or receiver", sender_username, receiver_username)
@@ -0,0 +1,11 @@
+# build_recommendation_snapshot.py
+import sys
+from recommender.snapshot import build_snapshot
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python build_recommendation_snapshot.py <users.json> <snapshot_dir>")
+        sys.exit(1)
+
+    index = build_snapshot(sys.argv[1], sys.argv[2])
+    print(f"Wrote recommendation snapshot of {len(index)} users to {sys.argv[2]}")
@@ -0,0 +1,3 @@
+# recommender/__init__.py
+# Friend recommendation index, approximate search and snapshots. Kept outside the `app` package so
+# offline tools (snapshot builds, benchmarks) can use it without starting the application.
@@ -0,0 +1,107 @@
+# recommender/ann.py
+import numpy as np
+from recommender.index import row_vector, top_n_rows
+
+
+class RandomProjectionLSH:
+    # Approximate nearest-neighbour index for cosine similarity. Each table hashes a row to the
+    # signs of `n_bits` random projections; rows sharing a bucket with the query in any table
+    # become candidates and are re-scored exactly.
+    #
+    # Recall/latency knob: more `n_tables` raises recall at the cost of larger candidate sets,
+    # more `n_bits` makes buckets smaller (faster, lower recall).
+    #
+    # Rows appended to the feature matrix later are hashed by update() into a small unsorted
+    # overflow per table, which is merged into the sorted arrays once it passes MERGE_FRACTION of
+    # the rows.
+    MERGE_FRACTION = 0.01
+
+    def __init__(self, features, n_tables=16, n_bits=10, seed=0):
+        if n_bits > 62:
+            raise ValueError("n_bits must be at most 62")
+        self.features = features
+        self.count = features.shape[0]
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+
+        self._rng = np.random.default_rng(seed)
+        self._planes = self._rng.standard_normal((n_tables, features.shape[1], n_bits))
+        self._weights = 1 << np.arange(n_bits, dtype=np.int64)
+
+        # Per table: rows sorted by bucket code, so a bucket is a contiguous searchsorted range
+        self._sorted_codes = []
+        self._sorted_rows = []
+        for table in range(n_tables):
+            codes = self._hash(features, table)
+            order = np.argsort(codes, kind='stable')
+            self._sorted_codes.append(codes[order])
+            self._sorted_rows.append(order)
+        self._extra_codes = [np.zeros(0, dtype=np.int64) for _ in range(n_tables)]
+        self._extra_rows = [np.zeros(0, dtype=np.int64) for _ in range(n_tables)]
+
+    def update(self, features):
+        # Hash the rows appended to `features` since the last build or update. Interest columns
+        # added since then get new projection rows; older rows are zero there, so their codes
+        # stay valid.
+        start, end = self.count, features.shape[0]
+        if features.shape[1] > self._planes.shape[1]:
+            extra = self._rng.standard_normal((self.n_tables, features.shape[1] - self._planes.shape[1], self.n_bits))
+            self._planes = np.concatenate([self._planes, extra], axis=1)
+        self.features = features
+        if end <= start:
+            return
+
+        new_rows = np.arange(start, end, dtype=np.int64)
+        merge = len(self._extra_rows[0]) + len(new_rows) > self.MERGE_FRACTION * end
+        for table in range(self.n_tables):
+            codes = np.concatenate([self._extra_codes[table], self._hash(features[start:end], table)])
+            rows = np.concatenate([self._extra_rows[table], new_rows])
+            if merge:
+                codes = np.concatenate([self._sorted_codes[table], codes])
+                rows = np.concatenate([self._sorted_rows[table], rows])
+                order = np.argsort(codes, kind='stable')
+                self._sorted_codes[table], self._sorted_rows[table] = codes[order], rows[order]
+                codes, rows = codes[:0], rows[:0]
+            self._extra_codes[table], self._extra_rows[table] = codes, rows
+        self.count = end
+
+    def _hash(self, vectors, table):
+        bits = (vectors @ self._planes[table]) > 0
+        return bits.astype(np.int64) @ self._weights
+
+    def candidates(self, vector):
+        vector = np.atleast_2d(vector)
+        buckets = []
+        for table in range(self.n_tables):
+            code = self._hash(vector, table)[0]
+            codes = self._sorted_codes[table]
+            start, end = np.searchsorted(codes, [code, code + 1])
+            buckets.append(self._sorted_rows[table][start:end])
+            buckets.append(self._extra_rows[table][self._extra_codes[table] == code])
+        return np.unique(np.concatenate(buckets))
+
+    def search(self, row, top_n=5):
+        # Approximate top-N for an indexed row; falls back to the exact scan when the buckets
+        # do not hold enough candidates
+        query = row_vector(self.features, row)
+        candidates = self.candidates(query)
+        candidates = candidates[candidates != row]
+        if len(candidates) < top_n:
+            return top_n_rows(self.features @ query, top_n, exclude=row)
+
+        positions, scores = top_n_rows(self.features[candidates] @ query, top_n)
+        return candidates[positions], scores
+
+
+def measure_recall(features, ann, rows, top_n=5):
+    # Mean fraction of the exact top-N neighbours that the approximate index also returns
+    if len(rows) == 0:
+        return 1.0
+    hits = 0
+    expected = 0
+    for row in rows:
+        exact, _ = top_n_rows(features @ row_vector(features, row), top_n, exclude=row)
+        approximate, _ = ann.search(row, top_n)
+        hits += len(np.intersect1d(exact, approximate))
+        expected += len(exact)
+    return hits / expected if expected else 1.0
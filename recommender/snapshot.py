@@ -0,0 +1,78 @@
+# recommender/snapshot.py
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from recommender.index import RecommendationIndex
+
+# Offline build step for the recommendation index. The normalised feature matrix, id/name arrays
+# and vocabulary are written as .npy files plus a small metadata.json, so web workers can memory
+# map them instead of parsing users.json and fitting the scalers at import time. Every worker
+# mapping the same files shares the physical pages through the OS page cache.
+#
+# Snapshot files are never rewritten in place: a rewrite would truncate pages workers have mapped
+# (SIGBUS) and let a worker load arrays from two builds. Each build is written to a fresh sibling
+# directory and the snapshot path, a symlink, is flipped to it with an atomic rename. The build
+# it replaces is kept for workers still loading it; older ones are removed.
+#
+# Build a snapshot with: python build_recommendation_snapshot.py data/users.json data/recommendation_snapshot
+
+METADATA_FILE = 'metadata.json'
+
+
+def save_snapshot(index, directory):
+    directory = os.path.abspath(directory)
+    parent, name = os.path.split(directory)
+    os.makedirs(parent, exist_ok=True)
+    build = tempfile.mkdtemp(prefix=f'{name}.build-', dir=parent)
+    # mkdtemp creates the directory readable by its owner only
+    os.chmod(build, 0o755)
+
+    arrays, metadata = index.snapshot_arrays()
+    for array_name, array in arrays.items():
+        np.save(os.path.join(build, f'{array_name}.npy'), array)
+    with open(os.path.join(build, METADATA_FILE), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+
+    previous = os.path.realpath(directory) if os.path.islink(directory) else None
+    if os.path.isdir(directory) and previous is None:
+        # A snapshot written before builds were versioned: move it aside so the link can replace it
+        previous = f'{build}.previous'
+        os.rename(directory, previous)
+    link = f'{build}.link'
+    os.symlink(os.path.basename(build), link)
+    os.replace(link, directory)
+
+    for entry in os.listdir(parent):
+        path = os.path.join(parent, entry)
+        if entry.startswith(f'{name}.build-') and path not in (build, previous) and os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def snapshot_exists(directory):
+    return bool(directory) and os.path.exists(os.path.join(directory, METADATA_FILE))
+
+
+def load_snapshot(directory, mmap_mode='r'):
+    # Resolved once, so every file comes from the same build even if the link is flipped meanwhile
+    directory = os.path.realpath(directory)
+    with open(os.path.join(directory, METADATA_FILE), 'r') as metadata_file:
+        metadata = json.load(metadata_file)
+
+    arrays = {}
+    for file_name in os.listdir(directory):
+        if file_name.endswith('.npy'):
+            arrays[file_name[:-4]] = np.load(os.path.join(directory, file_name), mmap_mode=mmap_mode)
+
+    return RecommendationIndex.from_arrays(arrays, metadata)
+
+
+def build_snapshot(users_path, directory):
+    with open(users_path, 'r') as json_file:
+        users_data = json.load(json_file)
+
+    index = RecommendationIndex.from_users(users_data['users'])
+    save_snapshot(index, directory)
+    return index
+
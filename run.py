@@ -1,5 +1,12 @@
 # run.py
-from app import app, socketio
+import os
+from app import app, socketio, start_background_services
 
 if __name__ == '__main__':
-    socketio.run(app, debug=False, host='0.0.0.0', port=5000)
+    start_background_services()
+    port = int(os.getenv('PORT', 5000))
+    if app.config['SERVER_MODE'] == 'asyncio':
+        import uvicorn
+        uvicorn.run('app.aio:asgi_app', host='0.0.0.0', port=port)
+    else:
+        socketio.run(app, debug=False, host='0.0.0.0', port=port)
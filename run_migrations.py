@@ -0,0 +1,7 @@
+# run_migrations.py
+from app import chat_messages_collection, migrations_collection
+from app.migrations.backfill_conversation_id import backfill_conversation_ids
+
+if __name__ == '__main__':
+    updated = backfill_conversation_ids(chat_messages_collection, migrations_collection)
+    print(f"Migration complete: {updated} messages updated")
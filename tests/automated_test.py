@@ -1,5 +1,4 @@
 import requests
-import json
 import socketio
 from colorama import init, Fore, Style
 from datetime import datetime
@@ -12,8 +11,9 @@ class Config:
     USER2_USERNAME = "user2"
     USER2_PASSWORD = "password2"
 
-# Initialize the socket.io client
-sio = socketio.Client()
+# One socket.io client per user: the server sends a message as the user its connection is
+# authenticated as
+clients = {Config.USER1_USERNAME: socketio.Client(), Config.USER2_USERNAME: socketio.Client()}
 
 # Helper functions for API requests
 def api_post(endpoint, data=None, headers=None):
@@ -96,7 +96,7 @@ def send_message(username, receiver_username, message):
         "receiver": receiver_username,
         "message": message,
     }
-    sio.emit("send_message", data)
+    clients[username].emit("send_message", data)
 
 # Function to get chat history using API
 def get_chat_history(receiver_username, token):
@@ -134,9 +134,7 @@ def print_chat_history(chat_history, sender, receiver_username):
         own_message_style = Fore.CYAN + Style.BRIGHT
         other_message_style = Fore.GREEN
 
-        for message_json in chat_messages:
-            message_data = json.loads(message_json)
-
+        for message_data in chat_messages:
             sender_username = message_data["sender_username"]
             content = message_data["content"]
             timestamp = message_data["timestamp"]
@@ -152,11 +150,10 @@ def print_chat_history(chat_history, sender, receiver_username):
                 print(formatted_message)
             print(Style.RESET_ALL)
 
-    except json.JSONDecodeError:
-        print("Invalid chat history JSON")
+    except (KeyError, TypeError):
+        print("Invalid chat history response")
 
 # Handle incoming messages from socket.io
-@sio.on("receive_message")
 def handle_received_message(data):
     sender = data.get('sender')
     content = data.get('content')
@@ -166,6 +163,9 @@ def handle_received_message(data):
     else:
         print("Incomplete message data received")
 
+for client in clients.values():
+    client.on("receive_message", handle_received_message)
+
 # Function to print online and offline users with colors
 def print_online_users(online_users_response):
     online_users = online_users_response.get('online_users', [])
@@ -226,10 +226,12 @@ if __name__ == "__main__":
     user2_token = login_user(Config.USER2_USERNAME, Config.USER2_PASSWORD)
     
     if user1_token and user2_token:
-        sio.connect(Config.BASE_URL)
+        clients[Config.USER1_USERNAME].connect(Config.BASE_URL, auth={"token": user1_token})
+        clients[Config.USER2_USERNAME].connect(Config.BASE_URL, auth={"token": user2_token})
         print(f"{Config.USER1_USERNAME} and {Config.USER2_USERNAME} connected to the Socket.IO server")
         
         interactive_chat(user1_token, user2_token)
         
-        sio.disconnect()
+        for client in clients.values():
+            client.disconnect()
         print(f"{Config.USER1_USERNAME} and {Config.USER2_USERNAME} disconnected from the Socket.IO server")
@@ -0,0 +1,26 @@
+# tests/conftest.py
+import os
+import sys
+
+# Unit tests, run from the repository root with: python -m pytest tests
+# The other scripts in this directory drive a running server and are not collected.
+collect_ignore = ['automated_test.py', 'interaction_test.py', 'load_test.py']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Tests importing `app` get the application on mongomock, as `load_test.py --mongo-uri mongomock://`
+# does; the app itself still needs a MongoDB URI and the settings below
+import mongomock
+import pymongo
+import flask_pymongo
+
+pymongo.MongoClient = flask_pymongo.MongoClient = mongomock.MongoClient
+os.environ.setdefault("MONGODB_ATLAS_URI", "mongodb://localhost")
+os.environ.setdefault("DATABASE_NAME", "chat_unit_test")
+os.environ.setdefault("USERS_COLLECTION", "users")
+os.environ.setdefault("CHAT_MESSAGES_COLLECTION", "chat_messages")
+os.environ.setdefault("SECRET_KEY", "unit-test-secret")
+os.environ.setdefault("JWT_SECRET_KEY", "unit-test-jwt-secret-at-least-32-bytes-long")
+os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
@@ -0,0 +1,93 @@
+import argparse
+import socketserver
+import threading
+
+# Local stand-in for Redis pub/sub, for trying multi-instance Socket.IO fan-out without a Redis
+# server. Speaks just enough of the Redis protocol for PING, PUBLISH and SUBSCRIBE.
+#
+# Example (two app instances sharing the stand-in):
+#   python tests/fake_redis_server.py --port 6390
+#   FANOUT_BACKEND=redis://localhost:6390 PORT=5000 python run.py
+#   FANOUT_BACKEND=redis://localhost:6390 PORT=5001 python run.py
+
+def encode(value):
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+class PubSubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, PubSubHandler)
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for handler in subscribers:
+            handler.send(encode([b"message", channel, message]))
+        return len(subscribers)
+
+class PubSubHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.subscriptions = set()
+
+    def send(self, data):
+        try:
+            with self.write_lock:
+                self.wfile.write(data)
+        except OSError:
+            pass
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def handle(self):
+        try:
+            while True:
+                command = self.read_command()
+                if command is None:
+                    break
+                name = command[0].upper()
+                if name == b"PING":
+                    self.send(b"+PONG\r\n")
+                elif name == b"PUBLISH":
+                    self.send(encode(self.server.publish(command[1], command[2])))
+                elif name == b"SUBSCRIBE":
+                    for channel in command[1:]:
+                        with self.server.lock:
+                            self.server.channels.setdefault(channel, set()).add(self)
+                        self.subscriptions.add(channel)
+                        self.send(encode([b"subscribe", channel, len(self.subscriptions)]))
+                else:
+                    self.send(b"-ERR unknown command\r\n")
+        finally:
+            with self.server.lock:
+                for channel in self.subscriptions:
+                    self.server.channels.get(channel, set()).discard(self)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal Redis pub/sub stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    with PubSubServer((args.host, args.port)) as server:
+        print(f"Listening on {args.host}:{args.port}")
+        server.serve_forever()
@@ -0,0 +1,52 @@
+import argparse
+import json
+import numpy as np
+
+# Synthetic population generator for the friend recommendation system. Users follow the
+# data/users.json schema: {"users": [{"id", "name", "age", "interests": {name: score}}]}.
+#
+# Example:
+#   python tests/generate_users.py --users 100000 --vocabulary 500 --interests-per-user 5 --output users_100k.json
+
+def generate_users(count, vocabulary_size=50, interests_per_user=4, skew=1.1, seed=0):
+    # Interest popularity follows a Zipf-like distribution controlled by `skew` (0 = uniform);
+    # the number of interests per user is Poisson around `interests_per_user`, which sets the
+    # sparsity of the interest matrix (interests_per_user / vocabulary_size non-zeros per row).
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"interest_{i}" for i in range(vocabulary_size)]
+    popularity = 1.0 / np.arange(1, vocabulary_size + 1) ** skew
+    popularity /= popularity.sum()
+
+    for user_id in range(1, count + 1):
+        size = int(min(vocabulary_size, max(1, rng.poisson(interests_per_user))))
+        chosen = rng.choice(vocabulary_size, size=size, replace=False, p=popularity)
+        scores = rng.integers(1, 101, size=size)
+        yield {
+            "id": user_id,
+            "name": f"User {user_id}",
+            "age": int(rng.integers(13, 90)),
+            "interests": {vocabulary[i]: int(score) for i, score in zip(chosen, scores)},
+        }
+
+def write_users(path, users):
+    # Stream the JSON document so a million users never have to be held in memory at once
+    with open(path, 'w') as output:
+        output.write('{"users": [\n')
+        for position, user in enumerate(users):
+            if position:
+                output.write(',\n')
+            output.write(json.dumps(user))
+        output.write('\n]}\n')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic users in the users.json schema")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--vocabulary", type=int, default=50, help="Number of distinct interests")
+    parser.add_argument("--interests-per-user", type=float, default=4, help="Mean interests per user (sparsity)")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of interest popularity, 0 for uniform")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="users_synthetic.json")
+    args = parser.parse_args()
+
+    write_users(args.output, generate_users(args.users, args.vocabulary, args.interests_per_user, args.skew, args.seed))
+    print(f"Wrote {args.users} users to {args.output}")
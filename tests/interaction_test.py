@@ -1,12 +1,12 @@
 import requests
 import socketio
 import time
-import json
 from colorama import init, Fore, Style
 from datetime import datetime
 
-# Initialize the socket.io client
-sio = socketio.Client()
+# Socket.IO clients by username, each connected with its user's token: the server sends a
+# message as the user its connection is authenticated as
+clients = {}
 
 # Define the base URL for the Flask application
 base_url = "http://localhost:5000"  # Replace with the actual URL
@@ -65,7 +65,7 @@ def send_message(username, receiver_username, message, token):
         "receiver": receiver_username,
         "message": message,
     }
-    sio.emit("send_message", data)
+    clients[username].emit("send_message", data)
 
 # Function to get chat history using API
 def get_chat_history(receiver_username, token):
@@ -82,8 +82,14 @@ def get_chat_history(receiver_username, token):
     response = post_request("/api/get_chat_history/", data, headers=headers)
     return response
 
+# Function to connect a user's socket.io client
+def connect_user(username, token):
+    client = socketio.Client()
+    client.on("receive_message", handle_received_message)
+    client.connect(base_url, auth={"token": token})
+    clients[username] = client
+
 # Function to handle incoming messages from socket.io
-@sio.on("receive_message")
 def handle_received_message(data):
     sender = data.get('sender')
     receiver = data.get('receiver')
@@ -96,10 +102,6 @@ def handle_received_message(data):
 
 def user_workflow(username1, username2):
     try:
-        # Connect to the Socket.IO server
-        sio.connect(base_url)
-        print(f"{username1} connected to the Socket.IO server")
-
         register_user(username1, 25, f"{username1}@example.com", "password1", ["chat"])
         token1 = login_user(username1, "password1")
 
@@ -107,6 +109,11 @@ def user_workflow(username1, username2):
         token2 = login_user(username2, "password2")
 
         if token1 and token2:
+            # Connect both users to the Socket.IO server
+            connect_user(username1, token1)
+            connect_user(username2, token2)
+            print(f"{username1} and {username2} connected to the Socket.IO server")
+
             # Define an array of messages to be sent between users
             messages = [
                 {"sender": username1, "receiver": username2, "content": "Hello"},
@@ -135,8 +142,9 @@ def user_workflow(username1, username2):
                 print("Failed to fetch chat history for one or more users")
 
             # After workflow is completed, disconnect from the socket.io server
-            sio.disconnect()
-            print(f"{username1} disconnected from the Socket.IO server")
+            for client in clients.values():
+                client.disconnect()
+            print(f"{username1} and {username2} disconnected from the Socket.IO server")
 
         else:
             print("User login failed. Cannot continue the workflow.")
@@ -165,8 +173,7 @@ def print_chat_history(chat_history):
         receiver = data["receiver"]
         messages = data["chat_history"]
         print(f"Chat history for {username} (with {receiver}):\n")
-        for message_str in messages:
-            message_data = json.loads(message_str)
+        for message_data in messages:
             sender = message_data.get('sender_username')
             content = message_data.get('content')
             timestamp = message_data.get('timestamp')
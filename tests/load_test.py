@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Headless load generator for the chat and REST paths. N simulated users register, log in, open
+# an authenticated Socket.IO connection, start a chat with a partner (users are paired) and send
+# messages at a fixed rate. Every message carries its send time, so the receiving client measures
+# end-to-end delivery latency. Results are printed and written as JSON.
+#
+# Against a running server:
+#   python tests/load_test.py --url http://localhost:5000 --users 200 --rate 2 --duration 60
+#
+# Starting a server for the run, backed by a local mongod or the in-memory stand-in (mongomock):
+#   python tests/load_test.py --start-server --mongo-uri mongodb://localhost:27017 --users 100
+#   python tests/load_test.py --start-server --mongo-uri mongomock:// --users 50
+#
+# With the in-memory stand-in the server's batched presence writes may fail on pymongo versions
+# newer than mongomock supports; they are logged by the server and do not affect message delivery.
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+def latency_summary(samples):
+    return {"count": len(samples), "p50_ms": percentile_ms(samples, 50), "p95_ms": percentile_ms(samples, 95), "p99_ms": percentile_ms(samples, 99)}
+
+def start_server(args):
+    # With mongomock:// the server runs on mongomock, patched in before the app creates its
+    # client; the app itself always needs a real MongoDB URI
+    in_memory = args.mongo_uri.startswith("mongomock://")
+    env = dict(os.environ, MONGODB_ATLAS_URI="mongodb://localhost" if in_memory else args.mongo_uri, PORT=str(args.port))
+    env.setdefault("DATABASE_NAME", "chat_load_test")
+    env.setdefault("USERS_COLLECTION", "users")
+    env.setdefault("CHAT_MESSAGES_COLLECTION", "chat_messages")
+    env.setdefault("SECRET_KEY", uuid.uuid4().hex)
+    env.setdefault("JWT_SECRET_KEY", uuid.uuid4().hex)
+    patch_mongo = "import mongomock, pymongo, flask_pymongo; pymongo.MongoClient = flask_pymongo.MongoClient = mongomock.MongoClient; " if in_memory else ""
+    # The Werkzeug server refuses to start without a terminal unless explicitly allowed
+    command = [sys.executable, "-c", (
+        patch_mongo + "import os; from app import app, socketio, start_background_services; "
+        "start_background_services(); socketio.run(app, host='127.0.0.1', port=int(os.environ['PORT']), allow_unsafe_werkzeug=True)"
+    )]
+    # In its own process group, so stop_server() also takes down the password hashing workers
+    server = subprocess.Popen(command, cwd=ROOT, env=env, start_new_session=True, stdout=subprocess.DEVNULL if args.quiet_server else None, stderr=subprocess.STDOUT if args.quiet_server else None)
+
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + args.server_timeout
+    try:
+        while time.time() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with status {server.returncode}")
+            try:
+                requests.get(f"{url}/metrics", timeout=1)
+                return server, url
+            except requests.RequestException:
+                time.sleep(0.5)
+        raise RuntimeError("Server did not start in time")
+    except BaseException:
+        stop_server(server)
+        raise
+
+def stop_server(server):
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    server.wait()
+
+class SimulatedUser:
+    def __init__(self, url, username, partner, stats):
+        self.url = url
+        self.username = username
+        self.partner = partner
+        self.stats = stats
+        self.token = None
+        self.sent = 0
+        self.client = socketio.Client(reconnection=False)
+        self.client.on("receive_message", self.on_message)
+        self.client.on("chat_started", lambda data: self.chat_ready.set())
+        self.client.on("chat_error", self.on_chat_error)
+        self.chat_ready = threading.Event()
+
+    def post(self, path, body, retries=20):
+        # Password hashing answers 503 when its queue is full; back off and retry
+        for attempt in range(retries):
+            started = time.perf_counter()
+            response = requests.post(f"{self.url}{path}", json=body, timeout=30)
+            self.stats.record(path, time.perf_counter() - started, response.status_code)
+            if response.status_code != 503:
+                return response
+            time.sleep(min(2.0, 0.05 * 2 ** attempt) * random.random())
+        return response
+
+    def register_and_login(self):
+        self.post("/api/register/", {"username": self.username, "email": f"{self.username}@example.com", "password": "load-test", "age": random.randint(18, 70), "interests": {"chat": 50}})
+        response = self.post("/api/login/", {"username": self.username, "password": "load-test"})
+        self.token = response.json().get("access_token") if response.status_code == 200 else None
+        return self.token is not None
+
+    def connect(self):
+        self.client.connect(self.url, auth={"token": self.token}, transports=["websocket"])
+
+    def start_chat(self, timeout):
+        # The partner has to be online (logged in) for start_chat to succeed; retry until it is
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self.client.emit("start_chat", {"username": self.username, "receiver": self.partner, "token": self.token})
+            if self.chat_ready.wait(1):
+                return True
+        return False
+
+    def on_chat_error(self, data):
+        self.stats.count("chat_error")
+
+    def on_message(self, data):
+        content = data.get("content", {}).get("content", "")
+        if data.get("receiver") == self.username and content.startswith("load:"):
+            sent_at = float(content.split(":")[2])
+            self.stats.delivered(time.perf_counter() - sent_at)
+
+    def send_loop(self, rate, stop):
+        # Messages at `rate` per second with a random phase, so users do not send in lockstep
+        interval = 1.0 / rate
+        next_send = time.perf_counter() + random.random() * interval
+        while not stop.is_set():
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                stop.wait(delay)
+                continue
+            self.sent += 1
+            self.client.emit("send_message", {"username": self.username, "receiver": self.partner, "message": f"load:{self.sent}:{time.perf_counter()}"})
+            self.stats.count("sent")
+            next_send += interval
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+def close_all(users, timeout=5):
+    # A disconnect waits for the server's close frame, which the development server does not
+    # always send; close in parallel and give up after `timeout` seconds
+    closers = [threading.Thread(target=user.close, daemon=True) for user in users]
+    for closer in closers:
+        closer.start()
+    deadline = time.time() + timeout
+    for closer in closers:
+        closer.join(max(0, deadline - time.time()))
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.latencies = []
+        self.requests = {}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def delivered(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def record(self, path, latency, status):
+        with self.lock:
+            entry = self.requests.setdefault(path, {"latencies": [], "statuses": {}})
+            entry["latencies"].append(latency)
+            entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+
+def run(args, url):
+    stats = Stats()
+    prefix = args.prefix or f"load{uuid.uuid4().hex[:8]}"
+    usernames = [f"{prefix}_{i}" for i in range(args.users + args.users % 2)]
+    users = [SimulatedUser(url, name, usernames[i ^ 1], stats) for i, name in enumerate(usernames)]
+
+    with ThreadPoolExecutor(args.setup_concurrency) as pool:
+        started = time.perf_counter()
+        logged_in = sum(pool.map(lambda user: user.register_and_login(), users))
+        setup_seconds = time.perf_counter() - started
+        users = [user for user in users if user.token]
+        list(pool.map(lambda user: user.connect(), users))
+        ready = sum(pool.map(lambda user: user.start_chat(args.start_timeout), users))
+    print(f"{logged_in} users logged in ({setup_seconds:.1f}s), {ready} chats started")
+
+    stop = threading.Event()
+    senders = [threading.Thread(target=user.send_loop, args=(args.rate, stop), daemon=True) for user in users if user.chat_ready.is_set()]
+    started = time.perf_counter()
+    for sender in senders:
+        sender.start()
+    time.sleep(args.duration)
+    stop.set()
+    for sender in senders:
+        sender.join()
+    send_seconds = time.perf_counter() - started
+    time.sleep(args.drain)
+
+    close_all(users)
+
+    sent = stats.counters.get("sent", 0)
+    delivered = len(stats.latencies)
+    return {
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "users": {"requested": len(usernames), "logged_in": logged_in, "chatting": len(senders)},
+        "messages": {
+            "sent": sent,
+            "delivered": delivered,
+            "delivery_ratio": delivered / sent if sent else None,
+            "sent_per_second": sent / send_seconds if send_seconds else None,
+            "delivered_per_second": delivered / send_seconds if send_seconds else None,
+        },
+        "delivery_latency": latency_summary(stats.latencies),
+        "requests": {path: dict(latency_summary(entry["latencies"]), statuses=entry["statuses"]) for path, entry in stats.requests.items()},
+        "chat_errors": stats.counters.get("chat_error", 0),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the chat server")
+    parser.add_argument("--url", default="http://localhost:5000", help="Server to test, unless --start-server is given")
+    parser.add_argument("--start-server", action="store_true", help="Start the app for the run")
+    parser.add_argument("--mongo-uri", default="mongomock://", help="MongoDB URI for --start-server (mongodb://... or mongomock://)")
+    parser.add_argument("--port", type=int, default=5055, help="Port for --start-server")
+    parser.add_argument("--server-timeout", type=float, default=60)
+    parser.add_argument("--quiet-server", action="store_true", help="Discard the started server's output")
+    parser.add_argument("--users", type=int, default=20, help="Simulated users, paired into conversations")
+    parser.add_argument("--rate", type=float, default=1.0, help="Messages per second sent by each user")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of sending")
+    parser.add_argument("--drain", type=float, default=2, help="Seconds to wait for deliveries after sending stops")
+    parser.add_argument("--setup-concurrency", type=int, default=8, help="Users registering and connecting at once")
+    parser.add_argument("--start-timeout", type=float, default=30, help="Seconds to wait for a chat partner to come online")
+    parser.add_argument("--prefix", help="Username prefix; a random one is used by default")
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if args.start_server:
+        server, url = start_server(args)
+    try:
+        report = run(args, url)
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    print(json.dumps({key: report[key] for key in ("users", "messages", "delivery_latency")}, indent=2))
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote load test results to {args.output}")
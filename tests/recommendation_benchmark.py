@@ -0,0 +1,123 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_users import generate_users
+from recommender.index import RecommendationIndex
+from recommender.ann import RandomProjectionLSH, measure_recall
+
+# Benchmark for the friend recommendation index. Each population size runs in a fresh process so
+# peak memory is measured per size. Only the `recommender` package is imported, so no database or
+# application settings are needed. Results are written as JSON so runs can be diffed between
+# versions.
+#
+# Example:
+#   python tests/recommendation_benchmark.py --sizes 10000 100000 1000000 --output recommendation_benchmark.json
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+def time_queries(search, user_ids):
+    latencies = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        search(user_id)
+        latencies.append(time.perf_counter() - start)
+    return {"p50_ms": percentile_ms(latencies, 50), "p99_ms": percentile_ms(latencies, 99)}
+
+def index_bytes(index):
+    arrays, _ = index.snapshot_arrays()
+    return int(sum(array.nbytes for array in arrays.values()))
+
+def run_size(size, args):
+    users = list(generate_users(size, args.vocabulary, args.interests_per_user, args.skew, args.seed))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    index = RecommendationIndex.from_users(users)
+    features = index.normalized_features()
+    build_seconds = time.perf_counter() - start
+    del users
+
+    rng = np.random.default_rng(args.seed)
+    query_ids = rng.choice(index.ids, size=min(args.queries, size), replace=False).tolist()
+
+    result = {
+        "users": size,
+        "nnz": int(features.nnz),
+        "build_seconds": build_seconds,
+        "index_bytes": index_bytes(index),
+        "exact": time_queries(lambda user_id: index.search(user_id, args.top_n), query_ids),
+    }
+
+    start = time.perf_counter()
+    batch_ids = query_ids[:args.batch_users]
+    for _ in index.search_batch(batch_ids, args.top_n):
+        pass
+    batch_seconds = time.perf_counter() - start
+    result["batch"] = {"users": len(batch_ids), "users_per_second": len(batch_ids) / batch_seconds if batch_seconds else None}
+
+    result["lsh"] = []
+    for n_tables, n_bits in args.lsh:
+        start = time.perf_counter()
+        ann = RandomProjectionLSH(features, n_tables=n_tables, n_bits=n_bits, seed=args.seed)
+        lsh_build_seconds = time.perf_counter() - start
+        rows = [index.row_of(user_id) for user_id in query_ids]
+        lsh_result = {"tables": n_tables, "bits": n_bits, "build_seconds": lsh_build_seconds}
+        lsh_result.update(time_queries(lambda row: ann.search(row, args.top_n), rows))
+        lsh_result["recall"] = measure_recall(features, ann, rows, args.top_n)
+        result["lsh"].append(lsh_result)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = peak * rss_scale / 2 ** 20
+    result["peak_rss_growth_mb"] = (peak - rss_before) * rss_scale / 2 ** 20
+    return result
+
+def parse_lsh(value):
+    n_tables, n_bits = value.split("x")
+    return int(n_tables), int(n_bits)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the friend recommendation index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--vocabulary", type=int, default=50)
+    parser.add_argument("--interests-per-user", type=float, default=4)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200, help="Single-user queries timed per size")
+    parser.add_argument("--batch-users", type=int, default=200, help="Users scored by the batch path per size")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--lsh", type=parse_lsh, nargs="*", default=[(16, 10)], help="LSH settings as TABLESxBITS")
+    parser.add_argument("--output", default="recommendation_benchmark.json")
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_size, (size, args))
+        print(json.dumps(result))
+        results.append(result)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote benchmark results to {args.output}")
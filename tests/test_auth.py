@@ -0,0 +1,21 @@
+# tests/test_auth.py
+import threading
+from app.services import auth
+from app.services.passwords import password_hasher
+
+
+def test_rehashed_password_is_stored_off_the_hashing_pool(monkeypatch):
+    stored = []
+    done = threading.Event()
+
+    def update_user_password(username, old_hash, new_hash):
+        stored.append((username, old_hash, threading.current_thread().name, password_hasher.check(new_hash, 'secret')))
+        done.set()
+
+    monkeypatch.setattr(auth.db, 'update_user_password', update_user_password)
+    auth.rehash_password('alice', 'old-hash', 'secret')
+
+    assert done.wait(10)
+    username, old_hash, thread_name, valid = stored[0]
+    assert (username, old_hash, valid) == ('alice', 'old-hash', True)
+    assert thread_name.startswith('password-rehash')
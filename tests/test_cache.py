@@ -0,0 +1,48 @@
+# tests/test_cache.py
+from app.services.cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.evictions == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=20)
+    clock.now = 5
+
+    assert cache.get('a', 'missing') == 'missing'
+    assert cache.get('b') == 2
+    clock.now = 20
+    assert cache.purge_expired() == 1
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 2
+
+
+def test_stats_count_hits_and_misses():
+    cache = LRUCache()
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+    assert cache.invalidate('a') and not cache.invalidate('a')
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
@@ -0,0 +1,43 @@
+# tests/test_fanout.py
+import socket
+import threading
+import time
+import pytest
+from app.services.fanout import RedisBackend
+from fake_redis_server import PubSubServer
+
+
+@pytest.fixture
+def pubsub_server():
+    server = PubSubServer(('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_publish_fails_instead_of_blocking_on_a_stalled_server():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    backend = RedisBackend(f"redis://127.0.0.1:{listener.getsockname()[1]}", timeout=0.2)
+    try:
+        started = time.monotonic()
+        with pytest.raises(OSError):
+            backend.publish('channel', [])
+        assert time.monotonic() - started < 2
+    finally:
+        backend.close()
+        listener.close()
+
+
+def test_subscriber_waits_longer_than_the_timeout(pubsub_server):
+    backend = RedisBackend(f"redis://127.0.0.1:{pubsub_server.server_address[1]}", timeout=0.2)
+    received = threading.Event()
+    backend.subscribe('channel', lambda message: received.set())
+    try:
+        time.sleep(0.6)
+        assert backend.publish('channel', ['event']) == 1
+        assert received.wait(2)
+    finally:
+        backend.close()
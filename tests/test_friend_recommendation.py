@@ -0,0 +1,14 @@
+# tests/test_friend_recommendation.py
+from app.services.friend_recommendation import recommendation_index, suggested_friends_batch
+
+
+def test_batch_stays_aligned_when_users_are_indexed_while_streaming():
+    missing_id = int(recommendation_index.ids.max()) + 1000
+    results = suggested_friends_batch([1, missing_id, 2], top_n=2)
+    assert next(results)[0] == 1
+
+    # Indexed after the batch started: still answered as unknown, and user 2 gets its own results
+    recommendation_index.add_user('late', 30, ['singing'], user_id=missing_id)
+    assert next(results) == (missing_id, {'error': 'User not found'})
+    user_id, response = next(results)
+    assert user_id == 2 and len(response['recommended_friends']) == 2
@@ -0,0 +1,65 @@
+# tests/test_history_pages.py
+import mongomock
+import pytest
+from app.services.history_pages import decode_cursor, encode_cursor, history_page, history_query
+
+
+@pytest.fixture
+def messages():
+    collection = mongomock.MongoClient().db.messages
+    for second in range(7):
+        # Two messages share each timestamp, so pages also have to order on _id
+        for sender, receiver in (("alice", "bob"), ("bob", "alice")):
+            collection.insert_one({
+                "sender_username": sender,
+                "receiver_username": receiver,
+                "content": f"{sender} {second}",
+                "timestamp": f"2024-01-01T00:00:0{second}",
+                "conversation_id": "5:alice:bob",
+            })
+    collection.insert_one({"content": "elsewhere", "timestamp": "2024-01-01T00:00:03", "conversation_id": "5:alice:carol"})
+    return collection
+
+
+def load_page(collection, limit, before=None, after=None):
+    query, sort, newer = history_query("alice", "bob", before=before, after=after)
+    documents = list(collection.find(query).sort(sort).limit(limit + 1))
+    return history_page(documents, limit, newer, after=after)
+
+
+def test_cursor_round_trip():
+    document = {"timestamp": "2024-01-01T00:00:00", "_id": mongomock.ObjectId()}
+    assert decode_cursor(encode_cursor(document)) == (document["timestamp"], document["_id"])
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24=", encode_cursor({"timestamp": "t", "_id": "not-an-id"})])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_before_and_after_are_exclusive():
+    with pytest.raises(ValueError):
+        history_query("alice", "bob", before="a", after="b")
+
+
+def test_paging_backwards_visits_every_message_once(messages):
+    page = load_page(messages, 5)
+    contents = [message["content"] for message in page["chat_history"]]
+    while page["before_cursor"]:
+        page = load_page(messages, 5, before=page["before_cursor"])
+        contents = [message["content"] for message in page["chat_history"]] + contents
+
+    expected = [f"{sender} {second}" for second in range(7) for sender in ("alice", "bob")]
+    assert contents == expected
+
+
+def test_polling_after_the_newest_message(messages):
+    page = load_page(messages, 20)
+    newest = page["after_cursor"]
+    assert load_page(messages, 20, after=newest)["chat_history"] == []
+    assert load_page(messages, 20, after=newest)["after_cursor"] == newest
+
+    messages.insert_one({"content": "new", "timestamp": "2024-01-01T00:00:09", "conversation_id": "5:alice:bob"})
+    newer = load_page(messages, 20, after=newest)
+    assert [message["content"] for message in newer["chat_history"]] == ["new"]
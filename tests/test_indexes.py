@@ -0,0 +1,22 @@
+# tests/test_indexes.py
+import pytest
+from pymongo.errors import OperationFailure
+from app import users_collection
+from app.services import indexes
+
+
+def test_indexes_are_created_once():
+    indexes.ensure_indexes()
+    indexes.ensure_indexes()
+    assert {'username_unique', 'email_unique', 'user_id'} <= set(users_collection.index_information())
+
+
+def test_startup_fails_without_the_unique_indexes(monkeypatch):
+    monkeypatch.setattr(users_collection, 'index_information', lambda: {})
+
+    def refuse(models):
+        raise OperationFailure("E11000 duplicate key error")
+
+    monkeypatch.setattr(users_collection, 'create_indexes', refuse)
+    with pytest.raises(RuntimeError, match='username_unique'):
+        indexes.ensure_indexes()
@@ -0,0 +1,65 @@
+# tests/test_message_writer.py
+import threading
+import pytest
+from pymongo.errors import PyMongoError
+from app.services.message_writer import ACK_ON_FLUSH, MessageQueueFull, MessageWriteBehind, MessageWriteError
+
+
+class FakeCollection:
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert_many(self, documents, ordered=True):
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.batches.append(documents)
+
+
+def test_queued_messages_are_written_in_batches_on_close():
+    collection = FakeCollection()
+    writer = MessageWriteBehind(collection, batch_size=3, flush_interval=0.05)
+    for number in range(7):
+        writer.submit({"n": number})
+    writer.close()
+
+    assert [document["n"] for batch in collection.batches for document in batch] == list(range(7))
+    assert all(len(batch) <= 3 for batch in collection.batches)
+
+
+def test_submit_after_close_is_refused():
+    writer = MessageWriteBehind(FakeCollection())
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit({})
+
+
+def test_flush_ack_reports_failed_batches():
+    writer = MessageWriteBehind(FakeCollection(error=PyMongoError("down")), ack_policy=ACK_ON_FLUSH, ack_timeout=5)
+    with pytest.raises(MessageWriteError):
+        writer.submit({})
+    writer.close()
+
+
+def test_full_queue_raises_after_enqueue_timeout():
+    collection = FakeCollection()
+    collection.release.clear()
+    writer = MessageWriteBehind(collection, batch_size=1, flush_interval=0.01, max_queue=1, enqueue_timeout=0.05)
+    with pytest.raises(MessageQueueFull):
+        # One message is held by the blocked writer and one fills the queue
+        for _ in range(3):
+            writer.submit({})
+    collection.release.set()
+    writer.close()
+
+
+def test_save_chat_message_reports_a_closed_writer(monkeypatch):
+    from app.services import database
+
+    writer = MessageWriteBehind(FakeCollection())
+    writer.close()
+    monkeypatch.setattr(database, 'message_writer', writer)
+    assert database.db.save_chat_message('alice', 'bob', 'hello') is False
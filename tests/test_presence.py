@@ -0,0 +1,116 @@
+# tests/test_presence.py
+from datetime import datetime
+from app.services.presence import PresencePersister, PresenceRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_registry(idle_timeout=None):
+    clock = FakeClock()
+    changes = []
+    registry = PresenceRegistry(clock=clock, on_change=lambda username, online: changes.append((username, online)), idle_timeout=idle_timeout)
+    return registry, clock, changes
+
+
+def test_user_is_online_while_any_session_is_connected():
+    registry, _, changes = make_registry()
+    registry.connect('alice', 'sid-1')
+    registry.connect('alice', 'sid-2')
+    registry.disconnect('sid-1')
+    assert registry.is_online('alice')
+
+    registry.disconnect('sid-2')
+    assert not registry.is_online('alice')
+    assert changes == [('alice', True), ('alice', False)]
+    assert registry.username_for('sid-2') is None
+
+
+def test_idle_sessions_stop_counting_until_the_next_heartbeat():
+    registry, clock, _ = make_registry(idle_timeout=60)
+    registry.connect('alice', 'sid-1')
+    clock.now += 61
+    registry.apply_snapshot({})
+    assert not registry.is_online('alice')
+
+    assert registry.heartbeat('sid-1') == 'alice'
+    assert registry.is_online('alice')
+
+
+def test_snapshot_adds_users_online_elsewhere():
+    registry, _, _ = make_registry()
+    registry.connect('alice', 'sid-1')
+    version = registry.version
+    registry.apply_snapshot({'bob': 5.0, 'carol': None})
+
+    page, total, page_version = registry.online_users(offset=1, limit=1)
+    assert (page, total) == ([('bob', 5.0)], 3)
+    assert page_version > version
+    registry.apply_snapshot({})
+    assert registry.online_users()[0] == [('alice', 1000.0)]
+
+
+def test_changes_update_the_snapshot():
+    registry, _, changes = make_registry()
+    registry.apply_snapshot({'bob': 5.0})
+    registry.apply_changes({'bob': (False, 6.0), 'carol': (True, 7.0)})
+
+    assert not registry.is_online('bob')
+    assert registry.online_users()[0] == [('carol', 7.0)]
+    assert sorted(changes) == [('bob', False), ('bob', True), ('carol', True)]
+
+
+def test_persister_writes_coalesced_changes_and_withdraws_local_users_on_close():
+    registry, _, _ = make_registry()
+    writes = []
+    persister = PresencePersister(registry, lambda node_id, updates: writes.append((node_id, updates)), lambda cursor: ({}, cursor))
+    registry.connect('alice', 'sid-1')
+    registry.disconnect('sid-1')
+    registry.connect('alice', 'sid-2')
+
+    assert persister.flush() == 1
+    assert writes[0] == (persister.node_id, {'alice': (True, datetime.fromtimestamp(1000.0))})
+
+    persister.close()
+    assert writes[-1][1]['alice'][0] is False
+
+
+def test_persister_loads_the_online_set_once_then_changes():
+    registry, _, _ = make_registry()
+    loads = []
+
+    def load(cursor):
+        loads.append(cursor)
+        if cursor is None:
+            return {'bob': (True, datetime.fromtimestamp(5)), 'carol': (True, None)}, 1
+        return {'bob': (False, datetime.fromtimestamp(6))}, cursor + 1
+
+    persister = PresencePersister(registry, lambda node_id, updates: None, load)
+    persister.refresh()
+    persister.refresh()
+
+    assert loads == [None, 1]
+    assert [username for username, _ in registry.online_users()[0]] == ['carol']
+
+
+def test_presence_changes_are_read_after_the_cursor():
+    from app import users_collection
+    from app.services.database import db
+
+    users_collection.delete_many({})
+    users_collection.insert_many([{"username": name, "email": f"{name}@example.com", "online": False} for name in ('alice', 'bob', 'carol')])
+    db.set_user_online('alice')
+    online, cursor = db.get_presence_changes()
+    assert set(online) == {'alice'} and cursor is not None
+
+    db.set_user_online('bob')
+    db.set_user_online('alice', online=False)
+    changes, _ = db.get_presence_changes(cursor)
+    # Changes within PRESENCE_CHANGES_OVERLAP of the cursor are read again
+    assert changes['bob'][0] is True and changes['alice'][0] is False
+    assert 'carol' not in changes
@@ -0,0 +1,156 @@
+# tests/test_recommendation_index.py
+import json
+import os
+import numpy as np
+import pytest
+from recommender.index import RecommendationIndex, StackedRows
+from recommender.ann import RandomProjectionLSH
+from recommender.snapshot import load_snapshot, save_snapshot
+
+USERS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'users.json')
+
+
+@pytest.fixture(scope='module')
+def users():
+    with open(USERS_PATH, 'r') as json_file:
+        return json.load(json_file)['users']
+
+
+def add_users(index, users):
+    for user in users:
+        index.add_user(user['name'], user['age'], user['interests'], user_id=user['id'], username=user.get('username'))
+
+
+def centred_top_n(users, index, top_n):
+    # Reference ranking: every feature standardised with centering, then cosine similarity
+    ages = np.array([user['age'] for user in users], dtype=float).reshape(-1, 1)
+    features = np.hstack([ages, index.interests_matrix().toarray()])
+    std = features.std(axis=0)
+    features = (features - features.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    similarities = features @ features.T
+    np.fill_diagonal(similarities, -np.inf)
+    return np.argsort(-similarities, axis=1, kind='stable')[:, :top_n]
+
+
+def test_ranking_stays_within_tolerance_of_centred_scaling(users):
+    # The uncentred sparse scaling documented on RecommendationIndex: 79% top-5 overlap and 73%
+    # top-1 agreement with the centred ranking on data/users.json
+    index = RecommendationIndex.from_users(users)
+    expected = centred_top_n(users, index, 5)
+
+    overlap, top_1 = [], []
+    for row, user in enumerate(users):
+        rows, _ = index.search(user['id'], 5)
+        overlap.append(len(np.intersect1d(rows, expected[row])) / 5)
+        top_1.append(rows[0] == expected[row, 0])
+
+    assert np.mean(overlap) >= 0.78
+    assert np.mean(top_1) >= 0.73
+
+
+def test_incremental_inserts_stay_close_to_a_refit(users):
+    fitted = len(users) - 50
+    index = RecommendationIndex.from_users(users[:fitted])
+    index.normalized_features()
+    add_users(index, users[fitted:])
+    # Within REFIT_GROWTH, so the appended rows were scaled with the first fit's statistics
+    assert index.normalization_epoch == 1
+
+    refitted = RecommendationIndex.from_users(users)
+    assert abs(index.normalized_features().tocsr() - refitted.normalized_features()).max() < 0.02
+    overlap = [len(np.intersect1d(index.search(user['id'], 5)[0], refitted.search(user['id'], 5)[0])) / 5 for user in users]
+    assert np.mean(overlap) >= 0.98
+
+
+def test_growth_past_refit_threshold_refits_everything(users):
+    index = RecommendationIndex.from_users(users[:500])
+    index.normalized_features()
+    add_users(index, users[500:])
+    assert index.normalization_epoch > 1
+
+    # The last refit covers exactly what a fresh fit over the same users gives
+    fitted = index._fitted_count
+    expected = RecommendationIndex.from_users(users[:fitted]).normalized_features()
+    features = index.normalized_features().tocsr()[:fitted]
+    assert abs(features[:, :expected.shape[1]] - expected).max() < 1e-12
+    assert features[:, expected.shape[1]:].nnz == 0
+
+
+def test_empty_index():
+    index = RecommendationIndex()
+    assert index.normalized_features().shape == (0, 1)
+    assert len(index.ids) == 0
+
+
+def test_interests_and_explanations(users):
+    index = RecommendationIndex.from_users(users[:100])
+    user = users[0]
+    assert index.get_user_interests(user['id']) == {name: float(score) for name, score in user['interests'].items()}
+
+    index.add_user('new', 30, ['singing', 'astronomy'], user_id=5000)
+    assert 'astronomy' in index.vocabulary
+    assert index.get_user_interests(5000) == {'singing': 1.0, 'astronomy': 1.0}
+    row = index.row_of(5000)
+    assert index.name_of(row) == 'new'
+    assert index.common_interests(5000, [row])[0][0] in ('singing', 'astronomy')
+    with pytest.raises(ValueError):
+        index.add_user('again', 30, {}, user_id=5000)
+
+
+def test_snapshot_base_stays_memory_mapped_after_inserts(users, tmp_path):
+    directory = str(tmp_path / 'snapshot')
+    base, appended = users[:900], users[900:950]
+    save_snapshot(RecommendationIndex.from_users(base), directory)
+
+    loaded = load_snapshot(directory)
+    built = RecommendationIndex.from_users(base)
+    built.normalized_features()
+    add_users(loaded, appended)
+    add_users(built, appended)
+
+    assert isinstance(loaded._base_ids, np.memmap)
+    assert isinstance(loaded._base_data, np.memmap)
+    assert isinstance(loaded._fitted_data, np.memmap)
+
+    features = loaded.normalized_features()
+    assert isinstance(features, StackedRows)
+    assert abs(features.tocsr() - built.normalized_features().tocsr()).max() < 1e-12
+    rows = np.array([920, 3, 949, 0])
+    assert abs(features[rows] - built.normalized_features()[rows]).max() < 1e-12
+    for user in (users[0], users[920]):
+        assert list(loaded.search(user['id'], 5)[0]) == list(built.search(user['id'], 5)[0])
+        assert loaded.get_user_interests(user['id']) == built.get_user_interests(user['id'])
+    assert list(loaded.ids) == [user['id'] for user in users[:950]]
+
+
+def test_snapshot_rebuild_switches_atomically(users, tmp_path):
+    directory = str(tmp_path / 'snapshot')
+    save_snapshot(RecommendationIndex.from_users(users[:100]), directory)
+    first = os.path.realpath(directory)
+    loaded = load_snapshot(directory)
+
+    save_snapshot(RecommendationIndex.from_users(users[:200]), directory)
+    save_snapshot(RecommendationIndex.from_users(users[:300]), directory)
+
+    assert os.path.islink(directory)
+    assert len(load_snapshot(directory)) == 300
+    # The build in use two rebuilds ago is removed; the one just replaced is kept
+    assert not os.path.exists(first)
+    assert len([entry for entry in os.listdir(tmp_path) if entry.startswith('snapshot.build-')]) == 2
+    # Still readable from the pages it had mapped
+    assert len(loaded.search(users[0]['id'], 5)[0]) == 5
+
+
+def test_lsh_update_hashes_appended_rows(users):
+    index = RecommendationIndex.from_users(users[:900])
+    ann = RandomProjectionLSH(index.normalized_features(), n_tables=8, n_bits=6)
+    add_users(index, users[900:950])
+
+    ann.update(index.normalized_features())
+    assert ann.count == 950
+    for user_id in (users[910]['id'], users[949]['id']):
+        row = index.row_of(user_id)
+        assert row in ann.candidates(index.normalized_features()[row].toarray())
+        rows, _ = ann.search(row, 5)
+        assert len(rows) == 5 and row not in rows